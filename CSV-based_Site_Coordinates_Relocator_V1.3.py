@@ -9,284 +9,487 @@ Last Revised By:  Kusasalethu Sithole
 Last Revision:    2020-08-19
 -------------------------------------------------------------------------'''
 
-print("\n\nTOOL - CSV-based Site Coordinates Relocator")
-print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
+if __name__ == "__main__":
+    print("\n\nTOOL - CSV-based Site Coordinates Relocator")
+    print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
 
 
 #Import Libraries
+import concurrent.futures
 import datetime
+import functools
+import numpy as np
 import os
 import pandas as pd
 import pathlib
 import re
 import time as t
+try:
+    import pyproj # only needed to relocate coordinates in a local projection
+except ImportError:
+    pyproj = None
 
 
-#---------------------------------------Declaring Data Paths, target fields and target location----------------------------------------------------------------------
-## Target csv input
-target_file = input("\nAbsolute path of the target csv file (MANDATORY): ")
-if target_file == "":
-    print("REMINDER: When running this tool, remember to specify the absolute path of the target csv according to request above.")
-    t.sleep(10)
-    exit()
-if not os.path.isfile(target_file):
-    print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the file actually exists.")
-    t.sleep(10)
-    exit()
-
-target_spreadsheet =  pd.read_csv(target_file)   # Load the csv input file
-target_file_name = os.path.basename(target_file) # capturing just the name of the csv input
-    
-## Target field inputs
-for column in target_spreadsheet.columns:
-    if re.search('9999', column.lower()):
-        point_geometry_field = column
-    if re.search('longitude', column.lower()) or column.lower() == "lon":
-        longitude_field = column
-    if re.search('latitude', column.lower()) or column.lower() == "lat":
-        latitude_field = column
+#---------------------------------------Processing settings----------------------------------------------------------------------
+field_sample_size = 1000 # number of rows read to determine the field names
+streaming_chunk_size = 250000 # number of rows read, relocated and written per chunk in streaming mode
+group_worker_count = os.cpu_count() # number of worker processes relocating the groups of a file in parallel
 
-try:
-    if point_geometry_field is not None:
-        pass
-except NameError:
-    point_geometry_field = ''
-try:
-    if longitude_field is not None:
-        pass
-except NameError:
-    longitude_field = ''
-try:
-    if latitude_field is not None:
-        pass
-except NameError:
-    latitude_field = ''     
-
-
-if point_geometry_field != '':
-    coordinate_nature = '1'
-elif longitude_field != '' or latitude_field != '':
-    coordinate_nature = '2'
-else:
-    coordinate_nature = ''
-
-if coordinate_nature == '':
-    coordinate_nature_input = input("We could not automatically determine the geometry fieldtypes used in your file. Does your csv have a point geometry field in the form of 'POINT (25.3657 -34.2568)' OR the separate coordinates fields of latitude and longitude. Enter 1 if your answer is the first choice OR enter 2 if your answer is the second choice (MANDATORY): ")
-    if coordinate_nature_input == "" or coordinate_nature_input == " ":
-        print("Please enter 1 or 2 based on your decision above.")
+
+#---------------------------Defining custom functions------------------
+def currentSecondsTime():
+    """ Returns the current time in seconds"""
+    return int(t.time())
+
+def timeTaken(startTime, endTime):
+    """ Returns the difference between a start time and an end time
+        formatted as 00:00:00 """
+    timeTaken = endTime - startTime
+    return str(datetime.timedelta(seconds=timeTaken))
+
+def showPyMessage(message, messageType="Message"):
+    """ Shows a formatted message to the user during processing. """
+    if (messageType == "Message"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Warning"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Error"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+
+def coerceCoordinates(longitudes, latitudes, row_offset=0):
+    """ Converts longitude and latitude columns to float64 arrays. Returns the
+        arrays and the csv row numbers (counting the header as row 1) of the
+        values which are not numbers. Empty values become NaN. """
+    numeric_longitudes = pd.to_numeric(longitudes, errors='coerce')
+    numeric_latitudes = pd.to_numeric(latitudes, errors='coerce')
+    mistyped_rows = (numeric_longitudes.isna() & longitudes.notna()) | (numeric_latitudes.isna() & latitudes.notna())
+    mistyped_row_numbers = mistyped_rows.to_numpy().nonzero()[0] + row_offset + 2
+    return numeric_longitudes.to_numpy(dtype=np.float64), numeric_latitudes.to_numpy(dtype=np.float64), mistyped_row_numbers
+
+def parsePointGeometries(point_geometries, row_offset=0):
+    """ Extracts the longitudes and latitudes of a column of WKT/EWKT point
+        geometries such as 'POINT (25.3657 -34.2568)', 'POINT Z (25.3657
+        -34.2568 1520)' or 'SRID=4326;POINT(25.3657 -34.2568)' into float64
+        arrays. Returns the arrays and the csv row numbers (counting the header
+        as row 1) of the malformed geometries. Empty values become NaN. """
+    point_pattern = r'{0}*(?:SRID=\d+{0}*;{0}*)?POINT{0}*(?:ZM|Z|M)?{0}*\({0}*([^{1}(),]+){0}+([^{1}(),]+)(?:{0}+[^{1}(),]+){{0,2}}{0}*\){0}*'
+    point_geometries = point_geometries.astype(object)
+    # one regex pass over all the geometries joined as lines, where lines which are not a point match the empty alternative
+    coordinates = re.findall(r'^(?:' + point_pattern.format(r'[ \t]', r'\s') + r'|.*)$', '\n'.join(point_geometries.fillna('').astype(str).tolist()), flags=re.IGNORECASE | re.MULTILINE)
+    if len(coordinates) == len(point_geometries):
+        coordinates = np.array(coordinates, dtype=object).reshape(-1, 2)
+    else: # some geometries span several lines
+        coordinates = np.array(point_geometries.str.extract(r'^' + point_pattern.format(r'\s', r'\s') + r'$', flags=re.IGNORECASE).fillna(''), dtype=object)
+    coordinates[coordinates == ''] = 'nan'
+    try:
+        coordinates = coordinates.astype(np.float64)
+    except ValueError: # some coordinates are not numbers
+        coordinates = np.column_stack([pd.to_numeric(coordinates[:, 0], errors='coerce'), pd.to_numeric(coordinates[:, 1], errors='coerce')]).astype(np.float64)
+    longitudes = coordinates[:, 0]
+    latitudes = coordinates[:, 1]
+    malformed_rows = (np.isnan(longitudes) | np.isnan(latitudes)) & point_geometries.notna().to_numpy()
+    malformed_row_numbers = malformed_rows.nonzero()[0] + row_offset + 2
+    return longitudes, latitudes, malformed_row_numbers
+
+def extractCoordinates(target_table, coordinate_nature, point_geometry_field, longitude_field, latitude_field, row_offset=0):
+    """ Returns the longitudes and latitudes of a table as float64 arrays,
+        taken from its point geometry field or its longitude and latitude
+        fields. Raises a ValueError listing the row numbers of the values
+        which are not correctly typed. """
+    if coordinate_nature == '1':
+        longitudes, latitudes, mistyped_row_numbers = parsePointGeometries(target_table[point_geometry_field], row_offset)
+        fields_description = "point geometry field"
+    else:
+        longitudes, latitudes, mistyped_row_numbers = coerceCoordinates(target_table[longitude_field], target_table[latitude_field], row_offset)
+        fields_description = "longitude and latitude fields"
+    if len(mistyped_row_numbers) > 0:
+        raise ValueError("\n\nEnsure that the values in your " + fields_description + " of row numbers " + ", ".join(str(row_number) for row_number in mistyped_row_numbers[:20]) + ("..." if len(mistyped_row_numbers) > 20 else "") + " of your csv file are indeed correctly typed. \n\n")
+    return longitudes, latitudes
+
+def placeCoordinates(target_table, longitudes, latitudes, coordinate_nature, point_geometry_field, longitude_field, latitude_field):
+    """ Writes the new coordinates into a table, replacing its point geometry
+        field with 'Longitude' and 'Latitude' fields or overwriting its
+        longitude and latitude fields. """
+    if coordinate_nature == '1':
+        target_table = target_table.drop(columns=[point_geometry_field])
+        target_table['Longitude'] = longitudes
+        target_table['Latitude'] = latitudes
+    else:
+        target_table[longitude_field] = longitudes
+        target_table[latitude_field] = latitudes
+    return target_table
+
+@functools.lru_cache(maxsize=64)
+def localProjectionTransformers(central_lon, central_lat, target_lon, target_lat):
+    """ Returns the transformers from WGS84 to a local azimuthal equidistant
+        frame centred on the current site, and from one centred on the new
+        site back to WGS84. They are built once per pair of centres. """
+    local_frame = "+proj=aeqd +lat_0={} +lon_0={} +datum=WGS84 +units=m +no_defs"
+    to_local_frame = pyproj.Transformer.from_crs("EPSG:4326", pyproj.CRS(local_frame.format(central_lat, central_lon)), always_xy=True)
+    from_local_frame = pyproj.Transformer.from_crs(pyproj.CRS(local_frame.format(target_lat, target_lon)), "EPSG:4326", always_xy=True)
+    return to_local_frame, from_local_frame
+
+def relocateCoordinates(longitudes, latitudes, central_lon, central_lat, target_lon, target_lat, shrink_stretch_value, local_projection=False):
+    """ Shifts arrays of coordinates from the central coordinates of the
+        current site to the central coordinates of the new site, scaling their
+        central deviation by the shrink/stretch value. With a local projection
+        the central deviation is measured in metres in an azimuthal
+        equidistant frame, so that the pattern keeps its shape and distances
+        across latitudes. """
+    if local_projection:
+        to_local_frame, from_local_frame = localProjectionTransformers(float(central_lon), float(central_lat), float(target_lon), float(target_lat))
+        located_points = ~(np.isnan(longitudes) | np.isnan(latitudes))
+        eastings, northings = to_local_frame.transform(longitudes[located_points], latitudes[located_points])
+        new_longitudes = np.full_like(longitudes, np.nan)
+        new_latitudes = np.full_like(latitudes, np.nan)
+        new_longitudes[located_points], new_latitudes[located_points] = from_local_frame.transform(np.asarray(eastings) * shrink_stretch_value, np.asarray(northings) * shrink_stretch_value)
+        return new_longitudes, new_latitudes
+    new_longitudes = (longitudes - central_lon) * shrink_stretch_value + target_lon
+    new_latitudes = (latitudes - central_lat) * shrink_stretch_value + target_lat
+    return new_longitudes, new_latitudes
+
+def loadGroupTargets(group_targets_file, shrink_stretch_value):
+    """ Reads the new central coordinates of each group from a csv file with
+        'group', 'target_lon' and 'target_lat' fields, and an optional
+        'shrink_stretch_value' field which defaults to the given value.
+        Returns a dictionary of (target_lon, target_lat, shrink_stretch_value)
+        keyed by group value. """
+    group_targets_table = pd.read_csv(group_targets_file, dtype=str)
+    missing_fields = [field for field in ['group', 'target_lon', 'target_lat'] if field not in group_targets_table.columns]
+    if missing_fields:
+        raise ValueError("\n\nEnsure that your group targets csv file has the fields: " + ", ".join(missing_fields) + ".\n\n")
+    if 'shrink_stretch_value' not in group_targets_table.columns:
+        group_targets_table['shrink_stretch_value'] = None
+    group_targets_table['shrink_stretch_value'] = group_targets_table['shrink_stretch_value'].fillna(str(shrink_stretch_value))
+    try:
+        return {row.group: (float(row.target_lon), float(row.target_lat), float(row.shrink_stretch_value)) for row in group_targets_table.itertuples(index=False)}
+    except ValueError:
+        raise ValueError("\n\nEnsure that the target coordinates and shrink/stretch values in your group targets csv file are indeed correctly typed.\n\n")
+
+def relocateGroup(longitudes, latitudes, target_lon, target_lat, shrink_stretch_value, local_projection):
+    """ Relocates the coordinates of one group around its own central
+        coordinates. Runs in the worker processes of relocateGroups(). """
+    return relocateCoordinates(longitudes, latitudes, np.nanmean(longitudes), np.nanmean(latitudes), target_lon, target_lat, shrink_stretch_value, local_projection)
+
+def relocateGroups(group_values, longitudes, latitudes, group_targets, local_projection=False):
+    """ Relocates the coordinates of each group (i.e. subject or site) around
+        its own central coordinates to its own target, running the groups on
+        a pool of worker processes. Returns the new coordinates in the
+        original row order. """
+    if group_values.isna().any():
+        raise ValueError("\n\nEnsure that every row of your csv file has a value in the group field. The rows " + ", ".join(str(row_number) for row_number in group_values.isna().to_numpy().nonzero()[0][:20] + 2) + " do not.\n\n")
+    group_codes, group_names = pd.factorize(group_values.astype(str))
+    missing_groups = [group_name for group_name in group_names if group_name not in group_targets]
+    if missing_groups:
+        raise ValueError("\n\nEnsure that your group targets csv file has the new central coordinates of the groups: " + ", ".join(missing_groups[:20]) + ("..." if len(missing_groups) > 20 else "") + ".\n\n")
+    row_order = np.argsort(group_codes, kind='stable')
+    group_rows = np.split(row_order, np.cumsum(np.bincount(group_codes))[:-1])
+    new_longitudes = np.empty_like(longitudes)
+    new_latitudes = np.empty_like(latitudes)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(group_worker_count, len(group_rows))) as executor:
+        group_relocations = [executor.submit(relocateGroup, longitudes[rows], latitudes[rows], *group_targets[group_name], local_projection) for group_name, rows in zip(group_names, group_rows)]
+        for rows, group_relocation in zip(group_rows, group_relocations):
+            new_longitudes[rows], new_latitudes[rows] = group_relocation.result()
+    return new_longitudes, new_latitudes
+
+
+if __name__ == "__main__":
+    #---------------------------------------Declaring Data Paths, target fields and target location----------------------------------------------------------------------
+    ## Target csv input
+    target_file = input("\nAbsolute path of the target csv file (MANDATORY): ")
+    if target_file == "":
+        print("REMINDER: When running this tool, remember to specify the absolute path of the target csv according to request above.")
         t.sleep(10)
         exit()
-    if coordinate_nature_input != '1' and coordinate_nature_input != '2':
-        print("Your answer must be either 1 or 2.")
+    if not os.path.isfile(target_file):
+        print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the file actually exists.")
         t.sleep(10)
         exit()
+
+    target_sample = pd.read_csv(target_file, nrows=field_sample_size)   # Load the first rows of the csv input file
+    target_file_name = os.path.basename(target_file) # capturing just the name of the csv input
+    
+    ## Target field inputs
+    for column in target_sample.columns:
+        if re.search('9999', column.lower()):
+            point_geometry_field = column
+        if re.search('longitude', column.lower()) or column.lower() == "lon":
+            longitude_field = column
+        if re.search('latitude', column.lower()) or column.lower() == "lat":
+            latitude_field = column
+
+    try:
+        if point_geometry_field is not None:
+            pass
+    except NameError:
+        point_geometry_field = ''
+    try:
+        if longitude_field is not None:
+            pass
+    except NameError:
+        longitude_field = ''
+    try:
+        if latitude_field is not None:
+            pass
+    except NameError:
+        latitude_field = ''     
+
+
+    if point_geometry_field != '':
+        coordinate_nature = '1'
+    elif longitude_field != '' or latitude_field != '':
+        coordinate_nature = '2'
     else:
-        coordinate_nature = coordinate_nature_input
-
-
-if coordinate_nature == '1':
-    ## Location field input
-    if point_geometry_field == '':
-        print("\n\nWe could not automatically determine the name of your point geometry field. The existing fields in this table are:")
-        for column in target_spreadsheet.columns:
-            print("\t " + str(column))
-        point_geometry_field_input = input("\nPlease state the exact name of the point geometry field in your csv file (MANDATORY): ")
-        if point_geometry_field_input == "" or point_geometry_field_input == " ":
-            print("REMINDER: When running this tool, remember to specify the name of the point geometry field according to request above.")
+        coordinate_nature = ''
+
+    if coordinate_nature == '':
+        coordinate_nature_input = input("We could not automatically determine the geometry fieldtypes used in your file. Does your csv have a point geometry field in the form of 'POINT (25.3657 -34.2568)' OR the separate coordinates fields of latitude and longitude. Enter 1 if your answer is the first choice OR enter 2 if your answer is the second choice (MANDATORY): ")
+        if coordinate_nature_input == "" or coordinate_nature_input == " ":
+            print("Please enter 1 or 2 based on your decision above.")
             t.sleep(10)
             exit()
-        else:
-            point_geometry_field = point_geometry_field_input
-            
-        field_no = len(target_spreadsheet.columns)
-        iter_no = 0
-        for field in target_spreadsheet.columns:
-            if field == point_geometry_field:
-                break 
-            elif  iter_no < field_no - 1:
-                iter_no += 1
-                continue
-            else:
-                print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
-                t.sleep(10)
-                exit()        
-    
-    target_spreadsheet['Longitude'] = ''
-    target_spreadsheet['Latitude'] = ''
-    try:
-        for index, row in target_spreadsheet.iterrows():
-            target_spreadsheet.loc[index, "Longitude"] = float(row[point_geometry_field].lstrip('POINT (').rstrip(')').split()[0])
-            target_spreadsheet.loc[index, "Latitude"] = float(row[point_geometry_field].lstrip('POINT (').rstrip(')').split()[1])
-    except ValueError:
-        print("\n\nEnsure that the values in your point geometry field of row number " + str(index + 2) + " of your csv file are indeed correctly typed\n\n")
-        t.sleep(60)
-        exit()
-    
-    longitude_field = 'Longitude'
-    latitude_field = 'Latitude'
-    
-elif coordinate_nature == '2':    
-    ## Longitude field input
-    if longitude_field == '':
-        print("\n\nWe could not automatically determine the name of your longitude field. The existing fields in this table are:")
-        for column in target_spreadsheet.columns:
-            print("\t " + str(column))
-        longitude_field_input = input("\nPlease state the exact name of the longitude field in your csv file (MANDATORY): ")
-        if longitude_field_input == "" or longitude_field_input == " ":
-            print("REMINDER: When running this tool, remember to specify the name of the longitude field according to request above.")
+        if coordinate_nature_input != '1' and coordinate_nature_input != '2':
+            print("Your answer must be either 1 or 2.")
             t.sleep(10)
             exit()
         else:
-            longitude_field = longitude_field_input
-        
-        field_no = len(target_spreadsheet.columns)
-        iter_no = 0
-        for field in target_spreadsheet.columns:
-            if field == longitude_field:
-                break 
-            elif  iter_no < field_no - 1:
-                iter_no += 1
-                continue
-            else:
-                print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+            coordinate_nature = coordinate_nature_input
+
+
+    if coordinate_nature == '1':
+        ## Location field input
+        if point_geometry_field == '':
+            print("\n\nWe could not automatically determine the name of your point geometry field. The existing fields in this table are:")
+            for column in target_sample.columns:
+                print("\t " + str(column))
+            point_geometry_field_input = input("\nPlease state the exact name of the point geometry field in your csv file (MANDATORY): ")
+            if point_geometry_field_input == "" or point_geometry_field_input == " ":
+                print("REMINDER: When running this tool, remember to specify the name of the point geometry field according to request above.")
                 t.sleep(10)
                 exit()
+            else:
+                point_geometry_field = point_geometry_field_input
+            
+            field_no = len(target_sample.columns)
+            iter_no = 0
+            for field in target_sample.columns:
+                if field == point_geometry_field:
+                    break 
+                elif  iter_no < field_no - 1:
+                    iter_no += 1
+                    continue
+                else:
+                    print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+                    t.sleep(10)
+                    exit()        
     
-    ## Latitude field input
-    if latitude_field == '':
-        print("\n\nWe could not automatically determine the name of your latitude field. The existing fields in this table are:")
-        for column in target_spreadsheet.columns:
-            print("\t " + str(column))
-        latitude_field_input = input("\nPlease state the exact name of the latitude field in your csv file (MANDATORY): ")
-        if latitude_field_input == "" or latitude_field_input == " ":
-            print("REMINDER: When running this tool, remember to specify the name of the latitude field according to request above.")
-            t.sleep(10)
-            exit()
-        else:
-            latitude_field = latitude_field_input
-        
-        field_no = len(target_spreadsheet.columns)
-        iter_no = 0
-        for field in target_spreadsheet.columns:
-            if field == latitude_field:
-                break 
-            elif  iter_no < field_no - 1:
-                iter_no += 1
-                continue
+    elif coordinate_nature == '2':    
+        ## Longitude field input
+        if longitude_field == '':
+            print("\n\nWe could not automatically determine the name of your longitude field. The existing fields in this table are:")
+            for column in target_sample.columns:
+                print("\t " + str(column))
+            longitude_field_input = input("\nPlease state the exact name of the longitude field in your csv file (MANDATORY): ")
+            if longitude_field_input == "" or longitude_field_input == " ":
+                print("REMINDER: When running this tool, remember to specify the name of the longitude field according to request above.")
+                t.sleep(10)
+                exit()
             else:
-                print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+                longitude_field = longitude_field_input
+        
+            field_no = len(target_sample.columns)
+            iter_no = 0
+            for field in target_sample.columns:
+                if field == longitude_field:
+                    break 
+                elif  iter_no < field_no - 1:
+                    iter_no += 1
+                    continue
+                else:
+                    print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+                    t.sleep(10)
+                    exit()
+    
+        ## Latitude field input
+        if latitude_field == '':
+            print("\n\nWe could not automatically determine the name of your latitude field. The existing fields in this table are:")
+            for column in target_sample.columns:
+                print("\t " + str(column))
+            latitude_field_input = input("\nPlease state the exact name of the latitude field in your csv file (MANDATORY): ")
+            if latitude_field_input == "" or latitude_field_input == " ":
+                print("REMINDER: When running this tool, remember to specify the name of the latitude field according to request above.")
                 t.sleep(10)
                 exit()
-
-    ### Correct lats and longs field data type
-    try:
-        for index, row in target_spreadsheet.iterrows():
-            target_spreadsheet.loc[index, longitude_field] = float(row[longitude_field])
-            target_spreadsheet.loc[index, latitude_field] = float(row[latitude_field])
-    except ValueError:
-        print("\n\nEnsure that the values in your longitude and latitude fields of row number " + str(index + 2) + " of your csv file are indeed correctly typed. \n\n")
-        t.sleep(60)
+            else:
+                latitude_field = latitude_field_input
+        
+            field_no = len(target_sample.columns)
+            iter_no = 0
+            for field in target_sample.columns:
+                if field == latitude_field:
+                    break 
+                elif  iter_no < field_no - 1:
+                    iter_no += 1
+                    continue
+                else:
+                    print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+                    t.sleep(10)
+                    exit()
+
+
+    ## Group field input
+    group_field = input("\nIf each subject or site in your csv file should be relocated around its own centre to its own new site, please state the exact name of the field which identifies them (OPTIONAL, if you leave answer as empty by pressing enter the whole file is relocated around one centre): ").strip()
+    if group_field != '' and group_field not in target_sample.columns:
+        print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+        t.sleep(10)
         exit()
 
-
-## Target Location Coordinates
-### Target Longitude
-target_lon_input = input("Please state the exact coordinates in decimal degrees of the central longitude (- for West and + for East) for your new site (MANDATORY): ")
-if target_lon_input == "" or target_lon_input == " ":
-    print("REMINDER: When running this tool, remember to specify the coordinates of the central longitude for your new site according to request above.")
-    t.sleep(10)
-    exit()
-else:
-    target_lon = target_lon_input
+    ## Target Location Coordinates
+    if group_field != '':
+        group_targets_file = input("Absolute path of the csv file with the new central coordinates in decimal degrees of each subject or site, in the fields 'group', 'target_lon' and 'target_lat' (and optionally 'shrink_stretch_value') (MANDATORY): ")
+        if not os.path.isfile(group_targets_file):
+            print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the file actually exists.")
+            t.sleep(10)
+            exit()
+        target_lon = None
+        target_lat = None
+
+    ### Target Longitude
+    if group_field == '':
+        target_lon_input = input("Please state the exact coordinates in decimal degrees of the central longitude (- for West and + for East) for your new site (MANDATORY): ")
+        if target_lon_input == "" or target_lon_input == " ":
+            print("REMINDER: When running this tool, remember to specify the coordinates of the central longitude for your new site according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            target_lon = target_lon_input
     
-### Target Latitude
-target_lat_input = input("Please state the exact coordinates in decimal degrees of the central latitude (- for South and + for North) for your new site (MANDATORY): ")
-if target_lat_input == "" or target_lat_input == " ":
-    print("REMINDER: When running this tool, remember to specify the coordinates of the central latitude for your new site according to request above.")
-    t.sleep(10)
-    exit()
-else:
-    target_lat = target_lat_input
+    ### Target Latitude
+    if group_field == '':
+        target_lat_input = input("Please state the exact coordinates in decimal degrees of the central latitude (- for South and + for North) for your new site (MANDATORY): ")
+        if target_lat_input == "" or target_lat_input == " ":
+            print("REMINDER: When running this tool, remember to specify the coordinates of the central latitude for your new site according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            target_lat = target_lat_input
     
     
-## Shrink Stretch Value
-shrink_stretch_value_input = input("Please state the desired shrink/stretch value for your coordinates pattern. i.e to apply no shrink or stretch to pattern just enter 1; OR to shrink the pattern by a constant of 2 enter 0.5 (which is 1/constant); OR to stretch the pattern by a constant of 4 enter 4 (MANDATORY): ")
-if shrink_stretch_value_input == "" or shrink_stretch_value_input == " ":
-    print("REMINDER: When running this tool, remember to specify the Shrink or Stretch Value for your new site according to request above.")
-    t.sleep(10)
-    exit()
-else:
-    shrink_stretch_value = shrink_stretch_value_input
-
+    ## Shrink Stretch Value
+    shrink_stretch_value_input = input("Please state the desired shrink/stretch value for your coordinates pattern. i.e to apply no shrink or stretch to pattern just enter 1; OR to shrink the pattern by a constant of 2 enter 0.5 (which is 1/constant); OR to stretch the pattern by a constant of 4 enter 4 (MANDATORY): ")
+    if shrink_stretch_value_input == "" or shrink_stretch_value_input == " ":
+        print("REMINDER: When running this tool, remember to specify the Shrink or Stretch Value for your new site according to request above.")
+        t.sleep(10)
+        exit()
+    else:
+        shrink_stretch_value = shrink_stretch_value_input
 
-#-----------------------------------------------Preparing the environment---------------------------------------------
-os.chdir(pathlib.Path(target_file).parent.absolute())
 
+    ## Local projection input
+    local_projection_input = input("Would you like the pattern to keep its true shape and distances when it is moved across latitudes? Enter Y to relocate the coordinates in a local azimuthal equidistant projection (requires the pyproj library, i.e. from your terminal run 'pip install pyproj') OR N to shift the coordinates directly in decimal degrees (OPTIONAL, if you leave answer as empty by pressing enter N is used): ").strip().upper()
+    if local_projection_input in ('Y', 'YES'):
+        local_projection = True
+        if pyproj is None:
+            print("REMINDER: The pyproj library is needed to relocate the coordinates in a local projection. Install it using your pip package (i.e. from your terminal run 'pip install pyproj') and run the tool again.")
+            t.sleep(10)
+            exit()
+    elif local_projection_input in ('', 'N', 'NO'):
+        local_projection = False
+    else:
+        print("REMINDER: When running this tool, remember to answer the local projection question with either Y or N.")
+        t.sleep(10)
+        exit()
 
-#---------------------------Defining custom functions------------------
-def currentSecondsTime():
-    """ Returns the current time in seconds"""
-    return int(t.time())
 
-def timeTaken(startTime, endTime):
-    """ Returns the difference between a start time and an end time
-        formatted as 00:00:00 """
-    timeTaken = endTime - startTime
-    return str(datetime.timedelta(seconds=timeTaken))
+    ## Processing mode input
+    if group_field != '':
+        processing_mode = '1' # the groups are relocated in parallel from memory
+    else:
+        processing_mode = input("How would you like your csv file to be processed? Enter 1 to load the whole file into memory; OR enter 2 for streaming mode, which reads and writes the file in chunks so that memory use stays constant (recommended for very large files) (OPTIONAL, if you leave answer as empty by pressing enter option 1 is used): ").strip()
+        if processing_mode == "":
+            processing_mode = '1'
+        elif processing_mode not in ('1', '2'):
+            print("REMINDER: When running this tool, remember to answer the processing mode question with either 1 or 2.")
+            t.sleep(10)
+            exit()
 
-def showPyMessage(message, messageType="Message"):
-    """ Shows a formatted message to the user during processing. """
-    if (messageType == "Message"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
-    if (messageType == "Warning"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
-    if (messageType == "Error"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
 
+    #-----------------------------------------------Preparing the environment---------------------------------------------
+    os.chdir(pathlib.Path(target_file).parent.absolute())
 
-startTime = currentSecondsTime()
 
+    startTime = currentSecondsTime()
 
-#--------------------------------------------------STEP 1: Determing the central coordinates of the current site---------------------------------------------
-print("\nStep 1: Determing the central coordinates of the current site from your " + target_file_name + " file.")
 
-target_spreadsheet_central_lon = target_spreadsheet[longitude_field].mean()
-target_spreadsheet_central_lat = target_spreadsheet[latitude_field].mean()
+    output_csv_file_name = target_file[:-4] + "_shifted.csv"
 
+    try:
+        if processing_mode == '2':
+            #--------------------------------------------------STEP 1: Determing the central coordinates of the current site---------------------------------------------
+            print("\nStep 1: Determing the central coordinates of the current site from your " + target_file_name + " file (streaming pass one of two).")
+
+            coordinate_fields = [point_geometry_field] if coordinate_nature == '1' else [longitude_field, latitude_field]
+            coordinate_count = 0
+            target_spreadsheet_central_lon = 0.0
+            target_spreadsheet_central_lat = 0.0
+            row_offset = 0
+            for coordinate_chunk in pd.read_csv(target_file, usecols=coordinate_fields, chunksize=streaming_chunk_size):
+                longitudes, latitudes = extractCoordinates(coordinate_chunk, coordinate_nature, point_geometry_field, longitude_field, latitude_field, row_offset)
+                row_offset += len(coordinate_chunk)
+                located_points = ~(np.isnan(longitudes) | np.isnan(latitudes))
+                chunk_count = int(located_points.sum())
+                if chunk_count == 0:
+                    continue
+                # running mean, merged chunk by chunk so that no large sums are accumulated
+                coordinate_count += chunk_count
+                target_spreadsheet_central_lon += (longitudes[located_points].mean() - target_spreadsheet_central_lon) * chunk_count / coordinate_count
+                target_spreadsheet_central_lat += (latitudes[located_points].mean() - target_spreadsheet_central_lat) * chunk_count / coordinate_count
+
+            #--------------------------------------------------STEP 2 & 3: Create new coordinates using the central deviation and central coordinates of the new site---------------------------------------------
+            print("\nStep 2 & 3: Determining the central deviation for each trackpoint and creating new coordinates using the central deviation and central coordinates of the new site, chunk by chunk (streaming pass two of two).")
+
+            with open(output_csv_file_name, 'w', newline='') as output_csv:
+                first_chunk = True
+                for target_chunk in pd.read_csv(target_file, dtype=str, chunksize=streaming_chunk_size):
+                    longitudes, latitudes = extractCoordinates(target_chunk, coordinate_nature, point_geometry_field, longitude_field, latitude_field)
+                    new_longitudes, new_latitudes = relocateCoordinates(longitudes, latitudes, target_spreadsheet_central_lon, target_spreadsheet_central_lat, float(target_lon), float(target_lat), float(shrink_stretch_value), local_projection)
+                    target_chunk = placeCoordinates(target_chunk, new_longitudes, new_latitudes, coordinate_nature, point_geometry_field, longitude_field, latitude_field)
+                    target_chunk.to_csv(output_csv, header=first_chunk, index=False)
+                    first_chunk = False
 
-#--------------------------------------------------STEP 2: Determining the central deviation for each trackpoint---------------------------------------------
-print("\nStep 2: Determining the central deviation for each trackpoint.")
+        else:
+            target_spreadsheet = pd.read_csv(target_file, dtype={group_field: str} if group_field != '' else None)   # Load the csv input file, keeping the group values as written (i.e. the leading zeros of 007)
 
-target_spreadsheet["lon_central_deviation"] = ''
-target_spreadsheet["lat_central_deviation"] = ''
+            #--------------------------------------------------STEP 1: Determing the central coordinates of the current site---------------------------------------------
+            print("\nStep 1: Determing the central coordinates of the current site from your " + target_file_name + " file.")
 
+            longitudes, latitudes = extractCoordinates(target_spreadsheet, coordinate_nature, point_geometry_field, longitude_field, latitude_field)
 
-for index, row in target_spreadsheet.iterrows():    
-    target_spreadsheet.loc[index, "lon_central_deviation"] = (row[longitude_field] - target_spreadsheet_central_lon) * float(shrink_stretch_value)
-    target_spreadsheet.loc[index, "lat_central_deviation"] = (row[latitude_field] - target_spreadsheet_central_lat) * float(shrink_stretch_value)
+            target_spreadsheet_central_lon = np.nanmean(longitudes)
+            target_spreadsheet_central_lat = np.nanmean(latitudes)
 
 
-#--------------------------------------------------STEP 3: Create new coordinates using the central deviation and central coordinates of the new site---------------------------------------------
-print("\nStep 3: Create new coordinates using the central deviation and central coordinates of the new site.")
+            #--------------------------------------------------STEP 2 & 3: Create new coordinates using the central deviation and central coordinates of the new site---------------------------------------------
+            print("\nStep 2 & 3: Determining the central deviation for each trackpoint and creating new coordinates using the central deviation and central coordinates of the new site.")
 
-for index, row in target_spreadsheet.iterrows():    
-    target_spreadsheet.loc[index, longitude_field] = row["lon_central_deviation"] + float(target_lon)
-    target_spreadsheet.loc[index, latitude_field] = row["lat_central_deviation"] + float(target_lat)
+            if group_field != '':
+                new_longitudes, new_latitudes = relocateGroups(target_spreadsheet[group_field], longitudes, latitudes, loadGroupTargets(group_targets_file, float(shrink_stretch_value)), local_projection)
+            else:
+                new_longitudes, new_latitudes = relocateCoordinates(longitudes, latitudes, target_spreadsheet_central_lon, target_spreadsheet_central_lat, float(target_lon), float(target_lat), float(shrink_stretch_value), local_projection)
+            target_spreadsheet = placeCoordinates(target_spreadsheet, new_longitudes, new_latitudes, coordinate_nature, point_geometry_field, longitude_field, latitude_field)
 
-if coordinate_nature == '1':
-    target_spreadsheet = target_spreadsheet.drop(columns=[point_geometry_field, "lon_central_deviation", "lat_central_deviation"])
-elif coordinate_nature == '2':
-    target_spreadsheet = target_spreadsheet.drop(columns=["lon_central_deviation", "lat_central_deviation"])
-    
-output_csv_file_name = target_file[:-4] + "_shifted.csv"
-target_spreadsheet.to_csv(output_csv_file_name, index=False)
+            target_spreadsheet.to_csv(output_csv_file_name, index=False)
+    except ValueError as error:
+        print(str(error))
+        t.sleep(60)
+        exit()
 
-endTime = currentSecondsTime()
+    endTime = currentSecondsTime()
 
 
-# --------------------------- End of Process ---------------------------
-print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
-showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
\ No newline at end of file
+    # --------------------------- End of Process ---------------------------
+    print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
+    showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
@@ -11,144 +11,36 @@ Last Revision:    2020-08-20
 -------------------------------------------------------------------------------'''
 
 
-print("\n\nTOOL - CSV-based Timestamp Updater")
-print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
+if __name__ == "__main__":
+    print("\n\nTOOL - CSV-based Timestamp Updater")
+    print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
 
 
 #Import Libraries
+import argparse
+import collections
+import concurrent.futures
+import csv
 import datetime as DT
 from datetime import datetime
+import functools
+import glob
+import json
+import mmap
+import numpy as np
 import os
 import pandas as pd
 import pathlib
 import re
+import sys
 import time as t
 
 
-#---------------------------------------Declaring Data Paths, target fields and target location----------------------------------------------------------------------
-## Target csv input
-target_file = input("\nAbsolute path of the target csv file (MANDATORY): ")
-if target_file == "":
-    print("REMINDER: When running this tool, remember to specify the absolute path of the target csv according to request above.")
-    t.sleep(10)
-    exit()
-if not os.path.isfile(target_file):
-    print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the file actually exists.")
-    t.sleep(10)
-    exit()
-
-target_spreadsheet =  pd.read_csv(target_file)   # Load the csv input file
-target_file_name = os.path.basename(target_file) # capturing just the name of the csv input
-    
-## Target field inputs
-for column in target_spreadsheet.columns:
-    if re.search('reported_at_\(gmt', column.lower()) or column.lower() == 'date':
-        timestamp_field = column
-    elif column.lower() == 'recorded_at':
-        timestamp_field = column
-
-try:
-    if timestamp_field is not None:
-        pass
-except NameError:
-    timestamp_field = ""  
-
-## Timestamp field input
-if timestamp_field == '':
-    print("\n\nWe could not automatically determine the name of your timestamp field. The existing fields in this table are:")
-    for column in target_spreadsheet.columns:
-        print("\t " + str(column))
-    timestamp_field_input = input("\nPlease state the exact name of the timestamp field in your csv file (MANDATORY): ")
-    if timestamp_field_input == "" or timestamp_field_input == " ":
-        print("REMINDER: When running this tool, remember to specify the name of the timestamp field according to request above.")
-        t.sleep(10)
-        exit()
-    else:
-        timestamp_field = timestamp_field_input
-        
-    field_no = len(target_spreadsheet.columns)
-    iter_no = 0
-    for field in target_spreadsheet.columns:
-        if field == timestamp_field:
-            break 
-        elif  iter_no < field_no - 1:
-            iter_no += 1
-            continue
-        else:
-            print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
-            t.sleep(10)
-            exit()        
-
-##Timestamp Notation    
-### Date Separator
-date_separators = ['/', '-']
-if re.search(date_separators[0], target_spreadsheet[timestamp_field][0]):
-    date_separation = date_separators[0]
-elif re.search(date_separators[1], target_spreadsheet[timestamp_field][0]):
-    date_separation = date_separators[1]
-else:
-    print("The date separator in your timestamp field is not accomodated in this tool. The date notation currently supported is '/' or '-'. You can either change this notation in your csv file OR notify the tool developers about this notification so that they can make accomodation for your date notation.")
-    t.sleep(20)
-    exit() 
-    
-### Date-Time Separator
-alphabets = 'abcdefghijklmnopqrstuvwxyz'
-datetime_separators = ' ' + alphabets + alphabets.upper()
-for datetime_separator in datetime_separators:
-    if re.search(datetime_separator, target_spreadsheet[timestamp_field][0]):
-        datetime_separation = datetime_separator
-
-try:
-    if datetime_separation is not None:
-        pass
-except NameError:
-    print("The datetime separator in your timestamp field is not accomodated in this tool. The datetime notation currently supported is a single space or an alphabet character (lower case or upper case). You can either change this notation in your csv file OR notify the tool developers about this notification so that they can make accomodation for your date notation.")
-    t.sleep(20)
-    exit()
-
-###time_notation
-time_char_count = 0
-plus_present = 0
-dot_present = 0
-for char in target_spreadsheet[timestamp_field][0]: 
-    if char == ':': 
-        time_char_count += 1
-    if char == '+':
-        plus_present = 1
-    if char == '.':
-        dot_present = 1
-
-if plus_present == 1:
-    for index, row in target_spreadsheet.iterrows():
-        target_spreadsheet.loc[index, timestamp_field] = row[timestamp_field].split('+')[0]
-        
-if dot_present == 1:
-    for index, row in target_spreadsheet.iterrows():
-        target_spreadsheet.loc[index, timestamp_field] = row[timestamp_field].split('.')[0]
-
-### Resultant timestamp notation
-if date_separation == date_separators[0]:
-    if time_char_count >= 2:
-        timestamp_notation = '%m/%d/%y{}%H:%M:%S'.format(datetime_separation)
-    elif time_char_count == 1:
-        timestamp_notation = '%m/%d/%y{}%H:%M'.format(datetime_separation)
-    elif time_char_count == 0:
-        timestamp_notation = '%m/%d/%y{}%H'.format(datetime_separation)
-elif date_separation == date_separators[1]:
-    if time_char_count >= 2:
-        timestamp_notation = '%Y-%m-%d{}%H:%M:%S'.format(datetime_separation)
-    elif time_char_count == 1:
-        timestamp_notation = '%Y-%m-%d{}%H:%M'.format(datetime_separation)
-    elif time_char_count == 0:
-        timestamp_notation = '%Y-%m-%d{}%H'.format(datetime_separation)
-    
-
-## Current Timestamp
-current_date = datetime.combine(datetime.today(), datetime.min.time())
-
-
-#-----------------------------------------------Preparing the environment---------------------------------------------
-os.chdir(pathlib.Path(target_file).parent.absolute())
+#---------------------------------------Processing settings----------------------------------------------------------------------
+format_sample_size = 1000 # number of rows sampled to determine the field names and the timestamp notation
+streaming_chunk_size = 250000 # number of rows read, rebased and written per chunk in streaming mode
+rewrite_block_size = 16 * 1024 * 1024 # number of bytes read, rebased and written per block in byte-level rewrite mode
+timestamp_notation_cache_file = os.path.join(pathlib.Path.home(), '.csv_timestamp_updater_cache.json') # timestamp notations of previously processed files
 
 
 #---------------------------Defining custom functions------------------
@@ -174,38 +66,507 @@ def showPyMessage(message, messageType="Message"):
         os.system('echo ' + str(t.ctime()) + " - " + message + "'")
         print(message)
 
+def cleanTimestamps(timestamps, strip_offset, strip_fraction):
+    """ Strips the '.fraction' and '+offset' parts off a column of timestamp
+        strings where the timestamp notation carries them. """
+    if strip_fraction:
+        timestamps = timestamps.str.split('.', n=1).str[0]
+    if strip_offset:
+        timestamps = timestamps.str.replace(r'(?:Z|[+-]\d{2}:?\d{2})$', '', regex=True)
+    return timestamps
+
+def inferTimestampNotation(sample_timestamps):
+    """ Votes on the timestamp notation of a sample of timestamp strings.
+        Returns the winning notation and whether offsets and fractions need
+        to be stripped, or a notation of None if no sample was recognised. """
+    notation_votes = collections.Counter()
+    strip_offset = False
+    strip_fraction = False
+    for timestamp in sample_timestamps.dropna():
+        timestamp_shape = re.match(r'^(\d{1,4})([/-])(\d{1,2})\2(\d{1,4})([ A-Za-z])(\d{1,2})(?::(\d{1,2}))?(?::(\d{1,2}))?(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$', timestamp.strip())
+        if timestamp_shape is None:
+            continue
+        year_first, date_separation, _, year_last, datetime_separation, _, minutes, seconds, fraction, offset = timestamp_shape.groups()
+        if date_separation == '/' and len(year_last) in (2, 4):
+            date_notation = '%m/%d/%y' if len(year_last) == 2 else '%m/%d/%Y'
+        elif date_separation == '-' and len(year_first) == 4:
+            date_notation = '%Y-%m-%d'
+        else:
+            continue
+        if seconds is not None:
+            time_notation = '%H:%M:%S'
+        elif minutes is not None:
+            time_notation = '%H:%M'
+        else:
+            time_notation = '%H'
+        notation_votes[date_notation + datetime_separation + time_notation] += 1
+        strip_offset = strip_offset or offset is not None
+        strip_fraction = strip_fraction or fraction is not None
+    if not notation_votes:
+        return None, False, False
+    return notation_votes.most_common(1)[0][0], strip_offset, strip_fraction
+
+def determineTimestampNotation(target_file, timestamp_field, sample_timestamps):
+    """ Returns the timestamp notation of a csv file, reusing the notation
+        cached for the same file signature (path, size and modification time)
+        on previous runs and inferring it from the sample timestamps otherwise. """
+    target_stat = os.stat(target_file)
+    file_signature = "|".join([os.path.abspath(target_file), str(target_stat.st_size), str(target_stat.st_mtime_ns), timestamp_field])
+    try:
+        with open(timestamp_notation_cache_file) as cache_json:
+            notation_cache = json.load(cache_json)
+    except (OSError, ValueError):
+        notation_cache = {}
+    if file_signature in notation_cache:
+        return tuple(notation_cache[file_signature])
+    timestamp_notation, strip_offset, strip_fraction = inferTimestampNotation(sample_timestamps)
+    if timestamp_notation is not None:
+        notation_cache[file_signature] = [timestamp_notation, strip_offset, strip_fraction]
+        notation_cache = dict(list(notation_cache.items())[-1000:]) # only the most recent files are kept
+        try:
+            # written to a temporary file first as batch workers may update the cache at the same time
+            with open(timestamp_notation_cache_file + '.' + str(os.getpid()), 'w') as cache_json:
+                json.dump(notation_cache, cache_json)
+            os.replace(timestamp_notation_cache_file + '.' + str(os.getpid()), timestamp_notation_cache_file)
+        except OSError:
+            pass
+    return timestamp_notation, strip_offset, strip_fraction
+
+@functools.lru_cache(maxsize=None)
+def compileSlicingParser(timestamp_notation):
+    """ Compiles a timestamp notation into the fixed offsets of each of its
+        components, assuming zero-padded components. Returns the total width,
+        the component offsets and the offsets of the literal separators. """
+    component_widths = {'Y': 4, 'y': 2, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+    components = {}
+    separators = []
+    width = 0
+    position = 0
+    while position < len(timestamp_notation):
+        if timestamp_notation[position] == '%':
+            directive = timestamp_notation[position + 1]
+            components[directive] = (width, width + component_widths[directive])
+            width += component_widths[directive]
+            position += 2
+        else:
+            separators.append((width, ord(timestamp_notation[position])))
+            width += 1
+            position += 1
+    return width, components, separators
+
+def parseFixedWidthTimestamps(timestamps, timestamp_notation):
+    """ Parses the timestamps which exactly match the zero-padded width of the
+        notation by slicing their digits out of a byte matrix. Returns NaT for
+        every other timestamp. """
+    parsed_timestamps = pd.Series(pd.NaT, index=timestamps.index, dtype='datetime64[ns]')
+    width, components, separators = compileSlicingParser(timestamp_notation)
+    try:
+        # one extra byte per row shows which timestamps are longer than the notation
+        timestamp_bytes = timestamps.to_numpy(dtype=object).astype('S{}'.format(width + 1))
+    except UnicodeEncodeError:
+        return parsed_timestamps
+    characters = timestamp_bytes.view(np.uint8).reshape(-1, width + 1)
+    digits = characters - np.uint8(48) # characters other than digits wrap around to values above 9
+    valid_rows = (characters[:, width] == 0) & (characters[:, width - 1] != 0)
+    for offset, separator in separators:
+        valid_rows &= characters[:, offset] == separator
+    values = {}
+    for directive, (start, end) in components.items():
+        values[directive] = np.zeros(len(characters), dtype=np.int64)
+        for position in range(start, end):
+            valid_rows &= digits[:, position] <= 9
+            values[directive] = values[directive] * 10 + digits[:, position]
+    if 'y' in values:
+        values['Y'] = np.where(values['y'] < 69, 2000, 1900) + values['y'] # same pivot year as strptime
+    year = values['Y']
+    month = values['m']
+    day = values['d']
+    hour = values.get('H', 0)
+    minute = values.get('M', 0)
+    second = values.get('S', 0)
+    leap_year = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    month_length = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 1, 12) - 1] + ((month == 2) & leap_year)
+    valid_rows &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_length) & (hour < 24) & (minute < 60) & (second < 60)
+    # days since 1970-01-01 of the proleptic Gregorian calendar date
+    shifted_year = year - (month <= 2)
+    era = shifted_year // 400
+    year_of_era = shifted_year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    epoch_seconds = (era * 146097 + day_of_era - 719468) * 86400 + hour * 3600 + minute * 60 + second
+    parsed_timestamps[valid_rows] = epoch_seconds[valid_rows].astype('datetime64[s]').astype('datetime64[ns]')
+    return parsed_timestamps
+
+def parseTimestamp(timestamp):
+    """ Parses a single timestamp string without a fixed notation. Returns NaT
+        if the value cannot be interpreted as a timestamp. """
+    try:
+        parsed_timestamp = pd.Timestamp(timestamp)
+    except (TypeError, ValueError):
+        return pd.NaT
+    if parsed_timestamp is not pd.NaT and parsed_timestamp.tzinfo is not None:
+        parsed_timestamp = parsed_timestamp.tz_localize(None)
+    return parsed_timestamp
+
+def parseTimestamps(timestamps, timestamp_notation):
+    """ Parses a column of timestamp strings into datetime64 values using the
+        inferred notation. The zero-padded timestamps are sliced by the fixed
+        width parser, the rest are parsed by the notation and only the rows
+        which do not match the notation are parsed one by one. """
+    parsed_timestamps = parseFixedWidthTimestamps(timestamps, timestamp_notation)
+    failed_rows = parsed_timestamps.isna() & timestamps.notna()
+    if failed_rows.any():
+        parsed_timestamps[failed_rows] = pd.to_datetime(timestamps[failed_rows], format=timestamp_notation, errors='coerce').astype('datetime64[ns]')
+        failed_rows = parsed_timestamps.isna() & timestamps.notna()
+    if failed_rows.any():
+        parsed_timestamps[failed_rows] = [parseTimestamp(timestamp) for timestamp in timestamps[failed_rows]]
+    return parsed_timestamps
+
+def reportUnparsedRows(timestamps, parsed_timestamps, row_offset=0):
+    """ Raises a ValueError listing the row numbers (excluding the header) of
+        the timestamps which could not be interpreted, if there are any. """
+    unparsed_rows = parsed_timestamps.isna() & timestamps.notna()
+    if unparsed_rows.any():
+        unparsed_row_numbers = unparsed_rows.to_numpy().nonzero()[0][:20] + row_offset + 1
+        raise ValueError("The timestamps in the following rows of your csv file could not be interpreted (row numbers exclude the header): " + ", ".join(str(row_number) for row_number in unparsed_row_numbers) + ("..." if unparsed_rows.sum() > 20 else "") + ". Please correct these timestamps and run the tool again.")
+
+def reportShortRecords(records, field_spans, row_offset=0):
+    """ Raises a ValueError listing the row numbers (excluding the header) of
+        the csv records which end before the timestamp field, if there are
+        any. Blank lines are ignored. """
+    short_rows = [row_number for row_number, (record, field_span) in enumerate(zip(records, field_spans)) if field_span is None and record.strip()]
+    if short_rows:
+        short_row_numbers = [row_number + row_offset + 1 for row_number in short_rows[:20]]
+        raise ValueError("The following rows of your csv file have fewer fields than the timestamp field (row numbers exclude the header): " + ", ".join(str(row_number) for row_number in short_row_numbers) + ("..." if len(short_rows) > 20 else "") + ". Please correct these rows and run the tool again.")
+
+def findFieldSpan(record, field_index):
+    """ Returns the start and end byte positions of a field in a csv record,
+        or None if the record does not have that many fields. """
+    content_end = len(record.rstrip(b'\r\n'))
+    if b'"' not in record:
+        start = 0
+        for _ in range(field_index):
+            start = record.find(b',', start, content_end) + 1
+            if start == 0:
+                return None
+        end = record.find(b',', start, content_end)
+        return start, content_end if end == -1 else end
+    current_field = 0
+    start = 0
+    in_quotes = False
+    for position in range(content_end):
+        char = record[position]
+        if char == 34: # '"'
+            in_quotes = not in_quotes
+        elif char == 44 and not in_quotes: # ','
+            if current_field == field_index:
+                return start, position
+            current_field += 1
+            start = position + 1
+    return (start, content_end) if current_field == field_index else None
+
+def iterRecordBlocks(mapped_file, header_end):
+    """ Yields lists of complete csv records (bytes, including their line
+        endings) read block by block from a memory-mapped csv file. Quoted
+        fields spanning several lines are kept within one record. """
+    position = header_end
+    pending_record = b''
+    while position < len(mapped_file):
+        block_end = mapped_file.find(b'\n', min(position + rewrite_block_size, len(mapped_file)) - 1)
+        block_end = len(mapped_file) if block_end == -1 else block_end + 1
+        records = []
+        for line in mapped_file[position:block_end].splitlines(keepends=True):
+            pending_record += line
+            if pending_record.count(b'"') % 2 == 0:
+                records.append(pending_record)
+                pending_record = b''
+        position = block_end
+        yield records
+    if pending_record:
+        yield [pending_record]
+
+def extractTimestampFields(records, field_index):
+    """ Returns the byte spans and the decoded values of the timestamp field
+        in a list of csv records. """
+    field_spans = [findFieldSpan(record, field_index) for record in records]
+    timestamps = []
+    for record, field_span in zip(records, field_spans):
+        field = record[field_span[0]:field_span[1]] if field_span is not None else b''
+        if field.startswith(b'"') and field.endswith(b'"') and len(field) > 1:
+            field = field[1:-1].replace(b'""', b'"')
+        timestamps.append(field.decode('utf-8') if field else None)
+    return field_spans, pd.Series(timestamps, dtype=object)
+
+def rebaseTimestamps(parsed_timestamps, latest_timestamp, current_date):
+    """ Creates new timestamps from the deviation of each timestamp from the
+        latest timestamp and the current timestamp. """
+    time_deviation = parsed_timestamps - latest_timestamp
+    return time_deviation + current_date + (parsed_timestamps - parsed_timestamps.dt.normalize())
+
+
+def updateTimestampFile(target_file, timestamp_field, timestamp_notation, strip_offset, strip_fraction, processing_mode, current_date, show_progress=True):
+    """ Rebases the timestamps of a csv file on the current date and writes
+        them to an '_updated.csv' copy of the file using the given processing
+        mode. Returns the number of rows processed. """
+    output_csv_file_name = target_file[:-4] + "_updated.csv"
+
+    if processing_mode == '2':
+        #--------------------------------------------------STEP 1: Determing the latest timestamp in the csv file---------------------------------------------
+        if show_progress:
+            print("\nStep 1: Determing the latest timestamp in the " + timestamp_field + " field of your " + os.path.basename(target_file) + " file (streaming pass one of two).")
+
+        chunk_latest_timestamps = []
+        row_offset = 0
+        for timestamp_chunk in pd.read_csv(target_file, usecols=[timestamp_field], dtype=str, chunksize=streaming_chunk_size):
+            timestamps = cleanTimestamps(timestamp_chunk[timestamp_field], strip_offset, strip_fraction)
+            parsed_timestamps = parseTimestamps(timestamps, timestamp_notation)
+            reportUnparsedRows(timestamps, parsed_timestamps, row_offset)
+            chunk_latest_timestamps.append(parsed_timestamps.max())
+            row_offset += len(timestamp_chunk)
+        latest_timestamp = pd.Series(chunk_latest_timestamps, dtype='datetime64[ns]').max()
+
+        #--------------------------------------------------STEP 2 & 3: Rebasing the timestamps chunk by chunk---------------------------------------------
+        if show_progress:
+            print("\nStep 2 & 3: Determining the deviation for each timestamp from the latest timestamp and creating new timestamps from the current timestamp, chunk by chunk (streaming pass two of two).")
+
+        with open(output_csv_file_name, 'w', newline='') as output_csv:
+            first_chunk = True
+            for target_chunk in pd.read_csv(target_file, dtype=str, chunksize=streaming_chunk_size):
+                parsed_timestamps = parseTimestamps(cleanTimestamps(target_chunk[timestamp_field], strip_offset, strip_fraction), timestamp_notation)
+                target_chunk[timestamp_field] = rebaseTimestamps(parsed_timestamps, latest_timestamp, current_date)
+                target_chunk.to_csv(output_csv, header=first_chunk, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                first_chunk = False
+
+    elif processing_mode == '3':
+        with open(target_file, 'rb') as target_csv, mmap.mmap(target_csv.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            header_end = mapped_file.find(b'\n') + 1 or len(mapped_file)
+            header = mapped_file[:header_end]
+            timestamp_field_index = next(csv.reader([header.decode('utf-8-sig')])).index(timestamp_field)
+
+            #--------------------------------------------------STEP 1: Determing the latest timestamp in the csv file---------------------------------------------
+            if show_progress:
+                print("\nStep 1: Determing the latest timestamp in the " + timestamp_field + " field of your " + os.path.basename(target_file) + " file (byte-level pass one of two).")
+
+            chunk_latest_timestamps = []
+            row_offset = 0
+            for records in iterRecordBlocks(mapped_file, header_end):
+                field_spans, timestamps = extractTimestampFields(records, timestamp_field_index)
+                reportShortRecords(records, field_spans, row_offset)
+                timestamps = cleanTimestamps(timestamps, strip_offset, strip_fraction)
+                parsed_timestamps = parseTimestamps(timestamps, timestamp_notation)
+                reportUnparsedRows(timestamps, parsed_timestamps, row_offset)
+                chunk_latest_timestamps.append(parsed_timestamps.max())
+                row_offset += len(records)
+            latest_timestamp = pd.Series(chunk_latest_timestamps, dtype='datetime64[ns]').max()
+
+            #--------------------------------------------------STEP 2 & 3: Rebasing the timestamps block by block---------------------------------------------
+            if show_progress:
+                print("\nStep 2 & 3: Determining the deviation for each timestamp from the latest timestamp and creating new timestamps from the current timestamp, rewriting only the timestamp field (byte-level pass two of two).")
+
+            with open(output_csv_file_name, 'wb', buffering=rewrite_block_size) as output_csv:
+                output_csv.write(header)
+                for records in iterRecordBlocks(mapped_file, header_end):
+                    field_spans, timestamps = extractTimestampFields(records, timestamp_field_index)
+                    parsed_timestamps = parseTimestamps(cleanTimestamps(timestamps, strip_offset, strip_fraction), timestamp_notation)
+                    new_timestamps = rebaseTimestamps(parsed_timestamps, latest_timestamp, current_date).dt.strftime('%Y-%m-%d %H:%M:%S')
+                    output_records = []
+                    for record, field_span, new_timestamp in zip(records, field_spans, new_timestamps):
+                        if field_span is None or not isinstance(new_timestamp, str):
+                            output_records.append(record)
+                            continue
+                        start, end = field_span
+                        quote = b'"' if record[start:start + 1] == b'"' else b''
+                        output_records.append(record[:start] + quote + new_timestamp.encode('utf-8') + quote + record[end:])
+                    output_csv.write(b''.join(output_records))
+
+    else:
+        target_spreadsheet = pd.read_csv(target_file)   # Load the csv input file
+        target_spreadsheet[timestamp_field] = cleanTimestamps(target_spreadsheet[timestamp_field], strip_offset, strip_fraction)
+
+        #--------------------------------------------------STEP 1: Determing the latest timestamp in the csv file---------------------------------------------
+        if show_progress:
+            print("\nStep 1: Determing the latest timestamp in the " + timestamp_field + " field of your " + os.path.basename(target_file) + " file.")
+
+        parsed_timestamps = parseTimestamps(target_spreadsheet[timestamp_field], timestamp_notation)
+        reportUnparsedRows(target_spreadsheet[timestamp_field], parsed_timestamps)
+
+        latest_timestamp = parsed_timestamps.max()
+
+        #--------------------------------------------------STEP 2 & 3: Creating new timestamps using the time deviations from the latest timestamp and the current timestamp---------------------------------------------
+        if show_progress:
+            print("\nStep 2 & 3: Determining the deviation for each timestamp from the latest timestamp and creating new timestamps from the current timestamp.")
+
+        target_spreadsheet[timestamp_field] = rebaseTimestamps(parsed_timestamps, latest_timestamp, current_date)
+
+        target_spreadsheet.to_csv(output_csv_file_name, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        row_offset = len(target_spreadsheet)
+
+    return row_offset
+
+def detectTimestampField(columns):
+    """ Returns the name of the timestamp field among the given field names,
+        or an empty string if it cannot be determined automatically. """
+    timestamp_field = ""
+    for column in columns:
+        if re.search('reported_at_\(gmt', column.lower()) or column.lower() == 'date':
+            timestamp_field = column
+        elif column.lower() == 'recorded_at':
+            timestamp_field = column
+    return timestamp_field
+
+def updateTimestampFileInBatch(target_file, processing_mode, current_date):
+    """ Updates one csv file of a batch without any user interaction. Returns
+        a summary of the file's processing for the batch summary. """
+    startTime = t.time()
+    summary = {'file': target_file, 'rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0, 'status': 'updated'}
+    try:
+        target_sample = pd.read_csv(target_file, nrows=format_sample_size, dtype=str)
+        timestamp_field = detectTimestampField(target_sample.columns)
+        if timestamp_field == "":
+            raise ValueError("The timestamp field could not be determined automatically.")
+        timestamp_notation, strip_offset, strip_fraction = determineTimestampNotation(target_file, timestamp_field, target_sample[timestamp_field])
+        if timestamp_notation is None:
+            raise ValueError("The notation of the timestamps in the " + timestamp_field + " field is not accomodated in this tool.")
+        summary['rows'] = updateTimestampFile(target_file, timestamp_field, timestamp_notation, strip_offset, strip_fraction, processing_mode, current_date, show_progress=False)
+    except Exception as error:
+        summary['status'] = 'failed: ' + str(error)
+    summary['seconds'] = round(t.time() - startTime, 3)
+    summary['rows_per_second'] = round(summary['rows'] / summary['seconds'], 1) if summary['seconds'] > 0 else 0.0
+    return summary
+
+def runBatchUpdate(batch_target, processing_mode, worker_count):
+    """ Updates every csv file in a directory (or matching a glob pattern) on
+        a pool of worker processes, anchoring all of them on the same current
+        date, and writes a summary of the rows processed per second per file
+        next to them. Returns the path of the summary csv. """
+    if os.path.isdir(batch_target):
+        target_files = glob.glob(os.path.join(batch_target, '*.csv'))
+        summary_directory = batch_target
+    else:
+        target_files = glob.glob(batch_target)
+        summary_directory = os.path.dirname(os.path.abspath(batch_target))
+    summary_csv_file_name = os.path.join(summary_directory, "timestamp_update_summary.csv")
+    target_files = sorted(target_file for target_file in target_files if not target_file.endswith("_updated.csv") and os.path.abspath(target_file) != os.path.abspath(summary_csv_file_name))
+    current_date = datetime.combine(datetime.today(), datetime.min.time())
+    print("\nUpdating the timestamps of " + str(len(target_files)) + " csv files on " + str(worker_count) + " worker processes.")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=worker_count) as executor:
+        summaries = list(executor.map(updateTimestampFileInBatch, target_files, [processing_mode] * len(target_files), [current_date] * len(target_files)))
+    for summary in summaries:
+        print("\t " + os.path.basename(summary['file']) + " - " + str(summary['rows']) + " rows at " + str(summary['rows_per_second']) + " rows per second - " + summary['status'])
+    pd.DataFrame(summaries, columns=['file', 'rows', 'seconds', 'rows_per_second', 'status']).to_csv(summary_csv_file_name, index=False)
+    return summary_csv_file_name
+
+
+#---------------------------------------Batch mode----------------------------------------------------------------------
+## Running the tool with arguments updates a whole directory of csv files without any user interaction, i.e.
+##   python CSV-based_Timestamp_Updater_V1.1.py --batch "C:\demo_data\site_a" --workers 8 --mode 3
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        argument_parser = argparse.ArgumentParser(description="Updates the timestamps of every csv file in a directory (or matching a glob pattern) as a spread from the current date.")
+        argument_parser.add_argument('--batch', required=True, help="directory of csv files, or a glob pattern such as 'C:\\demo_data\\*_tracks.csv'")
+        argument_parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes (default: the number of CPUs)")
+        argument_parser.add_argument('--mode', choices=['1', '2', '3'], default='1', help="processing mode: 1 in memory, 2 streaming, 3 byte-level rewrite (default: 1)")
+        arguments = argument_parser.parse_args()
+
+        startTime = currentSecondsTime()
+        summary_csv_file_name = runBatchUpdate(arguments.batch, arguments.mode, arguments.workers)
+        endTime = currentSecondsTime()
+
+        print("\n\nProcess completed. Please refer to the batch summary: " + summary_csv_file_name + ".")
+        showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
+        exit()
 
-startTime = currentSecondsTime()
 
+    #---------------------------------------Declaring Data Paths, target fields and target location----------------------------------------------------------------------
+    ## Target csv input
+    target_file = input("\nAbsolute path of the target csv file (MANDATORY): ")
+    if target_file == "":
+        print("REMINDER: When running this tool, remember to specify the absolute path of the target csv according to request above.")
+        t.sleep(10)
+        exit()
+    if not os.path.isfile(target_file):
+        print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the file actually exists.")
+        t.sleep(10)
+        exit()
 
-#--------------------------------------------------STEP 1: Determing the latest timestamp in the csv file---------------------------------------------
-print("\nStep 1: Determing the latest timestamp in the " + timestamp_field + " field of your " + target_file_name + " file.")
+    try:
+        target_sample = pd.read_csv(target_file, nrows=format_sample_size, dtype=str)   # Load the first rows of the csv input file
+    except UnicodeDecodeError:
+        print("REMINDER: Ensure that your csv file is saved with the UTF-8 encoding (i.e. from Excel, save it as 'CSV UTF-8 (Comma delimited)').")
+        t.sleep(10)
+        exit()
+    target_file_name = os.path.basename(target_file) # capturing just the name of the csv input
+    
+    ## Target field inputs
+    timestamp_field = detectTimestampField(target_sample.columns)
+
+    ## Timestamp field input
+    if timestamp_field == '':
+        print("\n\nWe could not automatically determine the name of your timestamp field. The existing fields in this table are:")
+        for column in target_sample.columns:
+            print("\t " + str(column))
+        timestamp_field_input = input("\nPlease state the exact name of the timestamp field in your csv file (MANDATORY): ")
+        if timestamp_field_input == "" or timestamp_field_input == " ":
+            print("REMINDER: When running this tool, remember to specify the name of the timestamp field according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            timestamp_field = timestamp_field_input
+    
+        field_no = len(target_sample.columns)
+        iter_no = 0
+        for field in target_sample.columns:
+            if field == timestamp_field:
+                break 
+            elif  iter_no < field_no - 1:
+                iter_no += 1
+                continue
+            else:
+                print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv file.")
+                t.sleep(10)
+                exit()        
+
+    ## Processing mode input
+    processing_mode = input("\nHow would you like your csv file to be processed? Enter 1 to load the whole file into memory; OR enter 2 for streaming mode, which reads and writes the file in chunks so that memory use stays constant (recommended for very large files); OR enter 3 for byte-level rewrite mode, which only rewrites the timestamp field and copies every other byte of the file through unchanged (fastest for very large files) (OPTIONAL, if you leave answer as empty by pressing enter option 1 is used): ").strip()
+    if processing_mode == "":
+        processing_mode = '1'
+    if processing_mode not in ('1', '2', '3'):
+        print("REMINDER: When running this tool, remember to answer the processing mode question with either 1, 2 or 3.")
+        t.sleep(10)
+        exit()
 
-latest_timestamp = datetime.strptime(target_spreadsheet[timestamp_field].max(), timestamp_notation)
+    ##Timestamp Notation
+    timestamp_notation, strip_offset, strip_fraction = determineTimestampNotation(target_file, timestamp_field, target_sample[timestamp_field])
+    if timestamp_notation is None:
+        print("The notation of the timestamps in your timestamp field is not accomodated in this tool. The date notation currently supported is 'mm/dd/yy', 'mm/dd/yyyy' or 'yyyy-mm-dd', followed by a single space or an alphabet character (lower case or upper case) and the time as 'HH', 'HH:MM' or 'HH:MM:SS'. You can either change this notation in your csv file OR notify the tool developers about this notification so that they can make accomodation for your timestamp notation.")
+        t.sleep(20)
+        exit()
+    
 
-#--------------------------------------------------STEP 2: Determining the deviation for each timestamp from the latest timestamp---------------------------------------------
-print("\nStep 2: Determining the deviation for each timestamp from the latest timestamp.")
+    ## Current Timestamp
+    current_date = datetime.combine(datetime.today(), datetime.min.time())
 
-target_spreadsheet["time_deviation"] = ''
 
-for index, row in target_spreadsheet.iterrows():
-    target_spreadsheet.loc[index, "time_deviation"] = datetime.strptime(row[timestamp_field], timestamp_notation) - latest_timestamp
+    #-----------------------------------------------Preparing the environment---------------------------------------------
+    os.chdir(pathlib.Path(target_file).parent.absolute())
 
-    
-#--------------------------------------------------STEP 3: Creating new timestamps using the time deviations from the latest timestamp and the current timestamp---------------------------------------------
-print("\nStep 3: Creating new timestamps using the time deviations from the latest timestamp and the current timestamp.")
 
-for index, row in target_spreadsheet.iterrows():    
-    target_spreadsheet.loc[index, timestamp_field] = row["time_deviation"] + current_date + (datetime.strptime(row[timestamp_field], timestamp_notation) - datetime.combine(datetime.strptime(row[timestamp_field], timestamp_notation), datetime.min.time()))
+    startTime = currentSecondsTime()
 
-target_spreadsheet = target_spreadsheet.drop(columns=["time_deviation"])
-    
-output_csv_file_name = target_file[:-4] + "_updated.csv"
-target_spreadsheet.to_csv(output_csv_file_name, index=False)
+    try:
+        updateTimestampFile(target_file, timestamp_field, timestamp_notation, strip_offset, strip_fraction, processing_mode, current_date)
+    except UnicodeDecodeError:
+        print("REMINDER: Ensure that your csv file is saved with the UTF-8 encoding (i.e. from Excel, save it as 'CSV UTF-8 (Comma delimited)').")
+        t.sleep(10)
+        exit()
+    except ValueError as error:
+        print(str(error))
+        t.sleep(20)
+        exit()
 
-endTime = currentSecondsTime()
+    endTime = currentSecondsTime()
 
 
-# --------------------------- End of Process ---------------------------
-print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
-showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
\ No newline at end of file
+    # --------------------------- End of Process ---------------------------
+    print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
+    showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
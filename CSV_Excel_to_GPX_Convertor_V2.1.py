@@ -10,164 +10,502 @@ Last Revised By:  Kusasalethu Sithole
 Last Revision:    2020-08-04
 -------------------------------------------------------------------------'''
 
-print("\n\nTOOL - CSV/Excel to GPX Converter")
-print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
+if __name__ == "__main__":
+    print("\n\nTOOL - CSV/Excel to GPX Converter")
+    print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
 
 
 #Import Libraries
+import concurrent.futures
 import datetime
+import hashlib
+import operator
 import os
+import numpy as np
 import pandas as pd
 import pathlib
 import re
+import shutil
+import tempfile
 import time as t
-import xml.etree.ElementTree as ET
-
-
-#---------------------------------------Declaring Data Paths and target fields----------------------------------------------------------------------
-## Target csv/excel input
-target_file = input("\nAbsolute path of the target csv/excel file (MANDATORY): ")
-if target_file == "":
-    print("REMINDER: When running this tool, remember to specify the absolute path of the target csv/excel according to request above.")
-    t.sleep(10)
-    exit()
-if not os.path.isfile(target_file):
-    print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the layer file actually exists.")
-    t.sleep(10)
-    exit()
-
-if os.path.splitext(target_file)[1] == '.csv':
-    target_spreadsheet =  pd.read_csv(target_file)   # Load the csv input file
-    target_file_name = os.path.basename(target_file) # capturing just the name of the csv input
-elif '.xlsx' or '.xls':
-    target_spreadsheet =  pd.read_excel(target_file)   # Load the excel input file
-    target_file_name = os.path.basename(target_file) # capturing just the name of the excel input
-else:
-    print("\nPlease ensure that your absolute path refer to either a .csv, .xlsx or .xls file.")
-    
-## Target field inputs
-print("\n\nThe existing fields in this table are:")
-for column in target_spreadsheet.columns:
-    print("\t " + str(column))
-    if re.search('longitude', column.lower()) or column.lower() == "lon":
-        longitude_field = column
-    if re.search('latitude', column.lower()) or column.lower() == "lat":
-        latitude_field = column
-    if re.search('date gmt +', column.lower()) or column.lower() == "created_at":
-        datetime_field = column
-    if re.search('elevation', column.lower()) or re.search('altitude', column.lower()):
-        elevation_field = column
-
-## Longitude field input
+import xml.sax.saxutils as saxutils
 try:
-    print("\nYour longitude fieldname is: " + longitude_field, end="")
-    longitude_field_input = input("If we have accurately determined the name of your longitude field, please press enter. If not, please type the correct name: ")
-    if longitude_field_input == "" or longitude_field_input == " ":
-        print("Longitude fieldname is now verified.")
+    import openpyxl # only needed to read xlsx workbooks
+except ImportError:
+    openpyxl = None
+
+
+#---------------------------------------Processing settings----------------------------------------------------------------------
+gpx_block_size = 100000 # number of track points formatted and written to the gpx file at a time
+gpx_buffer_size = 1024 * 1024 # size in bytes of the write buffer of the gpx file
+ingestion_cache_directory = os.path.join(os.path.expanduser("~"), ".csv_excel_to_gpx_cache") # directory of the columnar copies of the target fields of excel files already read (set to "" to disable)
+earth_radius = 6371008.8 # mean earth radius in metres used to measure track simplification tolerances and intervals
+track_worker_count = os.cpu_count() # number of worker processes serializing the subject tracks in parallel
+ingestion_cache_format = "parquet" # columnar format of the cached copies, either "parquet" or "feather" (both require the pyarrow library)
+
+
+#---------------------------Defining custom functions------------------
+def currentSecondsTime():
+    """ Returns the current time in seconds"""
+    return int(t.time())
+
+def timeTaken(startTime, endTime):
+    """ Returns the difference between a start time and an end time
+        formatted as 00:00:00 """
+    timeTaken = endTime - startTime
+    return str(datetime.timedelta(seconds=timeTaken))
+
+def showPyMessage(message, messageType="Message"):
+    """ Shows a formatted message to the user during processing. """
+    if (messageType == "Message"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Warning"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Error"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+
+def readTableHeader(target_file):
+    """ Returns the field names of a csv/excel file without loading its rows. """
+    file_extension = os.path.splitext(target_file)[1].lower()
+    if file_extension in ('.xlsx', '.xlsm'):
+        workbook = openpyxl.load_workbook(target_file, read_only=True, data_only=True)
+        try:
+            header = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return ["Unnamed: " + str(position) if name is None else str(name) for position, name in enumerate(header)]
+    if file_extension == '.csv':
+        return [str(column) for column in pd.read_csv(target_file, nrows=0).columns]
+    return [str(column) for column in pd.read_excel(target_file, nrows=0).columns]
+
+def readWorkbookFields(target_file, fields):
+    """ Streams the rows of the first sheet of an xlsx workbook in read-only
+        mode, keeping only the values of the given fields. """
+    header = readTableHeader(target_file)
+    positions = [header.index(field) for field in fields]
+    pick_values = operator.itemgetter(*positions)
+    row_length = max(positions) + 1
+    workbook = openpyxl.load_workbook(target_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(min_row=2, values_only=True)
+        records = [pick_values(row if len(row) >= row_length else row + (None,) * (row_length - len(row))) for row in rows]
+    finally:
+        workbook.close()
+    if len(positions) == 1:
+        records = [(value,) for value in records]
+    # like pandas, drop the empty rows left at the bottom of the sheet
+    while records and all(value is None for value in records[-1]):
+        records.pop()
+    return pd.DataFrame.from_records(records, columns=fields)
+
+def hashFile(target_file):
+    """ Returns the sha256 hex digest of the contents of a file. """
+    file_hash = hashlib.sha256()
+    with open(target_file, "rb") as target:
+        for block in iter(lambda: target.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def loadTargetFields(target_file, fields):
+    """ Loads only the given fields of a csv/excel file. Excel files are read
+        from a columnar copy in the ingestion cache when the same fields of a
+        file with the same contents were read before, and the copy is created
+        otherwise. """
+    fields = list(dict.fromkeys(fields))
+    file_extension = os.path.splitext(target_file)[1].lower()
+    if file_extension == '.csv':
+        return pd.read_csv(target_file, usecols=fields)[fields]
+    cache_file = ""
+    if ingestion_cache_directory:
+        fields_hash = hashlib.sha256("\n".join(fields).encode("UTF-8")).hexdigest()[:16]
+        cache_file = os.path.join(ingestion_cache_directory, hashFile(target_file) + "_" + fields_hash + "." + ingestion_cache_format)
+        if os.path.isfile(cache_file):
+            try:
+                if ingestion_cache_format == "feather":
+                    return pd.read_feather(cache_file)
+                return pd.read_parquet(cache_file)
+            except (ImportError, OSError, ValueError):
+                pass # unreadable cached copy, read the excel file again
+    if file_extension in ('.xlsx', '.xlsm'):
+        target_spreadsheet = readWorkbookFields(target_file, fields)
+    else:
+        target_spreadsheet = pd.read_excel(target_file, usecols=fields)[fields]
+    if cache_file:
+        temporary_cache_file = cache_file + ".tmp" + str(os.getpid())
+        try:
+            os.makedirs(ingestion_cache_directory, exist_ok=True)
+            if ingestion_cache_format == "feather":
+                target_spreadsheet.to_feather(temporary_cache_file)
+            else:
+                target_spreadsheet.to_parquet(temporary_cache_file, index=False)
+            os.replace(temporary_cache_file, cache_file)
+        except (ImportError, OSError, TypeError, ValueError):
+            # the cache is optional, e.g. pyarrow is missing or a field mixes text and numbers
+            if os.path.exists(temporary_cache_file):
+                os.remove(temporary_cache_file)
+    return target_spreadsheet
+
+def normalizeDatetimes(datetimes):
+    """ Converts a column of 'date time' values to ISO-8601 strings such as
+        2020-07-08T14:05:00Z. The format is inferred once from the first value
+        (dates like dd/mm/yyyy are read day first) and the whole column is
+        parsed with it. The values which do not follow it are parsed together
+        with format='mixed', reading dates with slashes day first and the
+        other dates (i.e. yyyy-mm-dd) as written. Values without a time
+        part or which cannot be parsed are kept as they are. """
+    datetime_values = datetimes.astype(str)
+    datetime_parts = datetime_values.str.split(n=2, expand=True)
+    if datetime_parts.shape[1] < 2:
+        return datetime_values
+    has_time = datetime_parts[1].notna()
+    date_times = datetime_parts.loc[has_time, 0] + " " + datetime_parts.loc[has_time, 1]
+    if date_times.empty:
+        return datetime_values
+    slashed_dates = datetime_parts.loc[has_time, 0].str.contains("/", regex=False)
+    datetime_format = pd.tseries.api.guess_datetime_format(date_times.iloc[0], dayfirst=bool(slashed_dates.iloc[0]))
+    if datetime_format is not None:
+        parsed_datetimes = pd.to_datetime(date_times, format=datetime_format, errors='coerce')
     else:
-        longitude_field = longitude_field_input    
-except NameError:
-    longitude_field_input = input("We could not automatically determine the name of your longitude field. Please state the exact name of the longitude field in your csv/excel file (MANDATORY): ")
-    if longitude_field_input == "" or longitude_field_input == " ":
-        print("REMINDER: When running this tool, remember to specify the name of the longitude field according to request above.")
+        parsed_datetimes = pd.Series(pd.NaT, index=date_times.index, dtype="datetime64[ns]")
+    unparsed = parsed_datetimes.isna()
+    if unparsed.any():
+        for dayfirst in (True, False):
+            rows = unparsed & (slashed_dates == dayfirst)
+            if rows.any():
+                parsed_datetimes[rows] = pd.to_datetime(date_times[rows], format='mixed', dayfirst=dayfirst, errors='coerce')
+    parsed_datetimes = parsed_datetimes.dropna()
+    datetime_values[parsed_datetimes.index] = parsed_datetimes.dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return datetime_values
+
+def trackIds(point_count, track_starts):
+    """ Returns the number of the track each point belongs to, given the row
+        where each track starts. """
+    return np.repeat(np.arange(len(track_starts)), np.diff(np.append(track_starts, point_count)))
+
+def douglasPeuckerMask(x, y, tolerance, track_starts):
+    """ Returns the mask of the points kept by Douglas-Peucker simplification
+        of tracks of projected x/y coordinates in metres. Instead of recursing
+        segment by segment, every pass measures the distance of all points to
+        the segment between their kept neighbours at once and splits each
+        segment at its farthest point beyond the tolerance. The first and last
+        points of each track are always kept. Points with missing coordinates
+        are kept and do not affect the simplification. """
+    located = np.isfinite(x) & np.isfinite(y)
+    keep = ~located
+    track_ends = np.append(track_starts[1:], len(x)) - 1
+    keep[track_starts] = True
+    keep[track_ends] = True
+    x, y = x[located], y[located]
+    fixed = keep[located] # track ends among the located points
+    if len(x) > 0:
+        fixed[[0, -1]] = True
+    while True:
+        kept = np.flatnonzero(fixed)
+        if len(kept) < 2:
+            break
+        segment = np.minimum(np.searchsorted(kept, np.arange(len(x)), side='right') - 1, len(kept) - 2)
+        start_x, start_y = x[kept[segment]], y[kept[segment]]
+        segment_x, segment_y = x[kept[segment + 1]] - start_x, y[kept[segment + 1]] - start_y
+        point_x, point_y = x - start_x, y - start_y
+        segment_length = segment_x * segment_x + segment_y * segment_y
+        with np.errstate(invalid='ignore', divide='ignore'):
+            position = np.clip(np.where(segment_length > 0, (point_x * segment_x + point_y * segment_y) / segment_length, 0.0), 0.0, 1.0)
+        distance = np.hypot(point_x - position * segment_x, point_y - position * segment_y)
+        distance[fixed] = 0.0
+        farthest_distance = np.maximum.reduceat(distance, kept[:-1])
+        farthest_points = np.flatnonzero((distance > tolerance) & (distance == farthest_distance[segment]))
+        if len(farthest_points) == 0:
+            break
+        # split each segment at its first farthest point only
+        fixed[farthest_points[np.unique(segment[farthest_points], return_index=True)[1]]] = True
+    keep[np.flatnonzero(located)[fixed]] = True
+    return keep
+
+def intervalMask(values, interval, track_starts):
+    """ Returns the mask of the first point of each track to fall in every
+        successive interval of the values (i.e. seconds or metres travelled)
+        measured from the start of its track. The first and last points of
+        each track and points without a value are always kept. """
+    track_ids = trackIds(len(values), track_starts)
+    with np.errstate(invalid='ignore'):
+        interval_numbers = np.floor((values - values[track_starts][track_ids]) / interval)
+    keep = ~np.isfinite(interval_numbers)
+    keep[1:] |= interval_numbers[1:] != interval_numbers[:-1]
+    keep[track_starts] = True
+    keep[np.append(track_starts[1:], len(values)) - 1] = True
+    return keep
+
+def simplifyTracks(extracted_table, simplification_mode, simplification_value, track_starts):
+    """ Returns the mask of the track points kept by the chosen simplification:
+        1 Douglas-Peucker with a tolerance in metres, 2 one point per time
+        interval in seconds or 3 one point per distance interval in metres. """
+    longitudes = np.radians(pd.to_numeric(extracted_table["Longitude"], errors='coerce').to_numpy(dtype=np.float64))
+    latitudes = np.radians(pd.to_numeric(extracted_table["Latitude"], errors='coerce').to_numpy(dtype=np.float64))
+    if simplification_mode == 1:
+        # equirectangular projection centred on the mean position of each track, accurate enough at the scale of a tolerance
+        track_ids = trackIds(len(longitudes), track_starts)
+        located = np.isfinite(longitudes) & np.isfinite(latitudes)
+        located_counts = np.maximum(np.bincount(track_ids[located], minlength=len(track_starts)), 1)
+        centre_longitudes = np.bincount(track_ids[located], weights=longitudes[located], minlength=len(track_starts)) / located_counts
+        centre_latitudes = np.bincount(track_ids[located], weights=latitudes[located], minlength=len(track_starts)) / located_counts
+        longitude_offsets = (longitudes - centre_longitudes[track_ids] + np.pi) % (2 * np.pi) - np.pi
+        x = earth_radius * longitude_offsets * np.cos(centre_latitudes[track_ids])
+        y = earth_radius * (latitudes - centre_latitudes[track_ids])
+        return douglasPeuckerMask(x, y, simplification_value, track_starts)
+    if simplification_mode == 2:
+        times = pd.to_datetime(extracted_table["Datetime"], format='%Y-%m-%dT%H:%M:%SZ', errors='coerce').to_numpy(dtype="datetime64[ns]")
+        seconds = np.where(np.isnat(times), np.nan, times.view(np.int64) / 1e9)
+        return intervalMask(seconds, simplification_value, track_starts)
+    # haversine distance travelled from the previous point, restarting at each track
+    steps = np.zeros(len(longitudes))
+    if len(steps) > 1:
+        half_chord = (np.sin(np.diff(latitudes) / 2) ** 2
+                      + np.cos(latitudes[:-1]) * np.cos(latitudes[1:]) * np.sin(np.diff(longitudes) / 2) ** 2)
+        steps[1:] = 2 * earth_radius * np.arcsin(np.sqrt(np.clip(half_chord, 0.0, 1.0)))
+    steps[track_starts] = 0.0
+    return intervalMask(np.cumsum(np.nan_to_num(steps)), simplification_value, track_starts)
+
+def escapeXml(values, attribute=False):
+    """ Escapes a column of strings for use as xml text or, with attribute
+        set, as double quoted xml attribute values. """
+    values = values.str.replace("&", "&amp;", regex=False).str.replace("<", "&lt;", regex=False).str.replace(">", "&gt;", regex=False)
+    if attribute:
+        values = values.str.replace('"', "&quot;", regex=False).str.replace("\n", "&#10;", regex=False)
+    return values
+
+def formatTrackPoints(track_points):
+    """ Formats a table of Latitude, Longitude, Elevation and Datetime values
+        as one string of gpx trkpt elements. """
+    trkpts = ('<trkpt lon="' + escapeXml(track_points["Longitude"].astype(str), attribute=True)
+              + '" lat="' + escapeXml(track_points["Latitude"].astype(str), attribute=True)
+              + '"><ele>' + escapeXml(track_points["Elevation"].astype(str))
+              + '</ele><time>' + escapeXml(track_points["Datetime"].astype(str))
+              + '</time></trkpt>')
+    return "".join(trkpts.tolist())
+
+def writeGpxHeader(gpx_file):
+    """ Writes the xml declaration and the opening gpx element. """
+    gpx_file.write("<?xml version='1.0' encoding='UTF-8'?>\n"
+                   '<gpx xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.topografix.com/GPX/1/1" '
+                   'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" '
+                   'version="1.1" creator="Open GPX Tracker for iOS">')
+
+def writeGpxTrack(gpx_file, track_point_blocks, track_name=None):
+    """ Writes blocks of track points as one trk element holding a single
+        track segment. Each block is formatted and written straight to the
+        file handle, so the xml document is never held in memory. """
+    gpx_file.write("<trk>" if track_name is None else "<trk><name>" + saxutils.escape(str(track_name)) + "</name>")
+    gpx_file.write("<trkseg>")
+    for track_points in track_point_blocks:
+        gpx_file.write(formatTrackPoints(track_points))
+    gpx_file.write("</trkseg></trk>")
+
+def writeGpxFile(gpx_file_name, track_point_blocks, track_name=None, whole_document=True):
+    """ Writes blocks of track points to a GPX 1.1 file as a single track.
+        Without whole_document only the trk element is written, for it to be
+        joined with other tracks into one gpx file. """
+    with open(gpx_file_name, "w", encoding="UTF-8", buffering=gpx_buffer_size) as gpx_file:
+        if whole_document:
+            writeGpxHeader(gpx_file)
+        writeGpxTrack(gpx_file, track_point_blocks, track_name)
+        if whole_document:
+            gpx_file.write("</gpx>")
+    return gpx_file_name
+
+def writeSubjectTrack(gpx_file_name, track_points, track_name, whole_document):
+    """ Writes the track of one subject. Runs in the worker processes of
+        writeSubjectTracks(). """
+    return writeGpxFile(gpx_file_name, splitIntoBlocks(track_points, gpx_block_size), track_name, whole_document)
+
+def sortBySubject(extracted_table, subject_field):
+    """ Sorts a table of track points by subject and then by time, keeping
+        the original order of points with the same time. Points without a
+        readable time are placed at the end of their subject's track. Returns
+        the sorted table and the row where each subject starts. """
+    subject_codes, subject_names = pd.factorize(extracted_table[subject_field], sort=True, use_na_sentinel=False)
+    times = pd.to_datetime(extracted_table["Datetime"], format='%Y-%m-%dT%H:%M:%SZ', errors='coerce').to_numpy(dtype="datetime64[ns]")
+    time_keys = np.where(np.isnat(times), np.iinfo(np.int64).max, times.view(np.int64))
+    row_order = np.lexsort((time_keys, subject_codes))
+    subject_starts = np.flatnonzero(np.diff(subject_codes[row_order], prepend=-1))
+    return extracted_table.iloc[row_order].reset_index(drop=True), list(subject_names), subject_starts
+
+def subjectFileName(gpx_file_name, subject_name):
+    """ Returns the name of the gpx file of one subject, i.e. collars.gpx and
+        subject 'ID 12/A' give collars_ID_12_A.gpx. """
+    return os.path.splitext(gpx_file_name)[0] + "_" + re.sub(r'[^\w\-.]+', '_', str(subject_name)).strip('_') + ".gpx"
+
+def subjectFileNames(gpx_file_name, subject_names):
+    """ Returns the names of the gpx files of the subjects. Subjects whose
+        file names would be the same (i.e. 'ID 12/A' and 'ID_12_A', or names
+        only differing in case) get their subject number added, so that no
+        two subjects write to the same file. """
+    file_names = [subjectFileName(gpx_file_name, subject_name) for subject_name in subject_names]
+    name_counts = pd.Series([file_name.lower() for file_name in file_names]).value_counts()
+    taken_names = set(file_name.lower() for file_name in file_names)
+    for subject_number, file_name in enumerate(file_names):
+        if name_counts[file_name.lower()] > 1:
+            while file_name.lower() in taken_names:
+                file_name = os.path.splitext(file_name)[0] + "_" + str(subject_number) + ".gpx"
+            taken_names.add(file_name.lower())
+            file_names[subject_number] = file_name
+    return file_names
+
+def writeSubjectTracks(gpx_file_name, sorted_table, subject_names, subject_starts, subject_file_names=None):
+    """ Serializes the track of each subject in parallel worker processes,
+        either into the given file of each subject or, without file names,
+        into one gpx file holding one trk element per subject. Returns the
+        names of the gpx files written. """
+    separate_files = subject_file_names is not None
+    subject_ends = list(subject_starts[1:]) + [len(sorted_table)]
+    part_directory = None if separate_files else tempfile.mkdtemp(prefix=".gpx_tracks_", dir=os.path.dirname(os.path.abspath(gpx_file_name)))
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=track_worker_count) as executor:
+            track_files = []
+            for subject_number, (subject_name, start, end) in enumerate(zip(subject_names, subject_starts, subject_ends)):
+                track_file_name = subject_file_names[subject_number] if separate_files else os.path.join(part_directory, str(subject_number) + ".part")
+                track_files.append(executor.submit(writeSubjectTrack, track_file_name, sorted_table.iloc[start:end], subject_name, separate_files))
+            track_files = [track_file.result() for track_file in track_files]
+        if separate_files:
+            return track_files
+        # join the trk elements, in subject order, into one gpx file
+        with open(gpx_file_name, "w", encoding="UTF-8", buffering=gpx_buffer_size) as gpx_file:
+            writeGpxHeader(gpx_file)
+            for track_file_name in track_files:
+                with open(track_file_name, "r", encoding="UTF-8") as track_file:
+                    shutil.copyfileobj(track_file, gpx_file, gpx_buffer_size)
+            gpx_file.write("</gpx>")
+        return [gpx_file_name]
+    finally:
+        if part_directory is not None:
+            shutil.rmtree(part_directory, ignore_errors=True)
+
+def splitIntoBlocks(table, block_size):
+    """ Yields consecutive slices of a table holding at most block_size rows. """
+    for start in range(0, len(table), block_size):
+        yield table.iloc[start:start + block_size]
+
+
+if __name__ == "__main__":
+    #---------------------------------------Declaring Data Paths and target fields----------------------------------------------------------------------
+    ## Target csv/excel input
+    target_file = input("\nAbsolute path of the target csv/excel file (MANDATORY): ")
+    if target_file == "":
+        print("REMINDER: When running this tool, remember to specify the absolute path of the target csv/excel according to request above.")
         t.sleep(10)
         exit()
-    else:
-        longitude_field = longitude_field_input
-    
-field_no = len(target_spreadsheet.columns)
-iter_no = 0
-for field in target_spreadsheet.columns:
-    if field == longitude_field:
-        break 
-    elif  iter_no < field_no - 1:
-        iter_no += 1
-        continue
-    else:
-        print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+    if not os.path.isfile(target_file):
+        print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the layer file actually exists.")
         t.sleep(10)
         exit()
 
-## Latitude field input
-try:
-    print("\nYour latitude fieldname is: " + latitude_field, end="")
-    latitude_field_input = input("If we have accurately determined the name of your latitude field, please press enter. If not, please type the correct name: ")
-    if latitude_field_input == "" or latitude_field_input == " ":
-        print("Latitude fieldname is now verified.")
-    else:
-        latitude_field = latitude_field_input    
-except NameError:
-    latitude_field_input = input("We could not automatically determine the name of your latitude field. Please state the exact name of the latitude field in your csv/excel file (MANDATORY): ")
-    if latitude_field_input == "" or latitude_field_input == " ":
-        print("REMINDER: When running this tool, remember to specify the name of the latitude field according to request above.")
+    if os.path.splitext(target_file)[1].lower() not in ('.csv', '.xlsx', '.xlsm', '.xls'):
+        print("\nPlease ensure that your absolute path refer to either a .csv, .xlsx or .xls file.")
         t.sleep(10)
         exit()
-    else:
-        latitude_field = latitude_field_input
-    
-field_no = len(target_spreadsheet.columns)
-iter_no = 0
-for field in target_spreadsheet.columns:
-    if field == latitude_field:
-        break 
-    elif  iter_no < field_no - 1:
-        iter_no += 1
-        continue
-    else:
-        print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+    if os.path.splitext(target_file)[1].lower() in ('.xlsx', '.xlsm') and openpyxl is None:
+        print("REMINDER: The openpyxl library is needed to read xlsx files. Install it using your pip package (i.e. from your terminal run 'pip install openpyxl') and run the tool again.")
         t.sleep(10)
         exit()
+    target_columns = readTableHeader(target_file) # Load only the field names of the csv/excel input file
+    target_file_name = os.path.basename(target_file) # capturing just the name of the csv/excel input
+
+    ## Target field inputs
+    print("\n\nThe existing fields in this table are:")
+    for column in target_columns:
+        print("\t " + str(column))
+        if re.search('longitude', column.lower()) or column.lower() == "lon":
+            longitude_field = column
+        if re.search('latitude', column.lower()) or column.lower() == "lat":
+            latitude_field = column
+        if re.search('date gmt +', column.lower()) or column.lower() == "created_at":
+            datetime_field = column
+        if re.search('elevation', column.lower()) or re.search('altitude', column.lower()):
+            elevation_field = column
+
+    ## Longitude field input
+    try:
+        print("\nYour longitude fieldname is: " + longitude_field, end="")
+        longitude_field_input = input("If we have accurately determined the name of your longitude field, please press enter. If not, please type the correct name: ")
+        if longitude_field_input == "" or longitude_field_input == " ":
+            print("Longitude fieldname is now verified.")
+        else:
+            longitude_field = longitude_field_input    
+    except NameError:
+        longitude_field_input = input("We could not automatically determine the name of your longitude field. Please state the exact name of the longitude field in your csv/excel file (MANDATORY): ")
+        if longitude_field_input == "" or longitude_field_input == " ":
+            print("REMINDER: When running this tool, remember to specify the name of the longitude field according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            longitude_field = longitude_field_input
+    
+    field_no = len(target_columns)
+    iter_no = 0
+    for field in target_columns:
+        if field == longitude_field:
+            break 
+        elif  iter_no < field_no - 1:
+            iter_no += 1
+            continue
+        else:
+            print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+            t.sleep(10)
+            exit()
 
-## Datetime field input
-try:
-    print("\nYour Datetime fieldname is: " + datetime_field, end="")
-    datetime_field_input = input("If we have accurately determined the name of your datetime field, please press enter. If not, please type the correct name: ")
-    if datetime_field_input == "" or datetime_field_input == " ":
-        print("Datetime fieldname is now verified.")
-    else:
-        datetime_field = datetime_field_input    
-except NameError:
-    datetime_field_input = input("We could not automatically determine the name of your datetime field. Please state the exact name of the datetime field in your csv/excel file (MANDATORY and format must be YYYY-MM-DD HH:MM:SS): ")
-    if datetime_field_input == "" or datetime_field_input == " ":
-        print("REMINDER: When running this tool, remember to specify the name of the datetime field according to request above.")
-        t.sleep(10)
-        exit()
-    else:
-        datetime_field = datetime_field_input
+    ## Latitude field input
+    try:
+        print("\nYour latitude fieldname is: " + latitude_field, end="")
+        latitude_field_input = input("If we have accurately determined the name of your latitude field, please press enter. If not, please type the correct name: ")
+        if latitude_field_input == "" or latitude_field_input == " ":
+            print("Latitude fieldname is now verified.")
+        else:
+            latitude_field = latitude_field_input    
+    except NameError:
+        latitude_field_input = input("We could not automatically determine the name of your latitude field. Please state the exact name of the latitude field in your csv/excel file (MANDATORY): ")
+        if latitude_field_input == "" or latitude_field_input == " ":
+            print("REMINDER: When running this tool, remember to specify the name of the latitude field according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            latitude_field = latitude_field_input
     
-field_no = len(target_spreadsheet.columns)
-iter_no = 0
-for field in target_spreadsheet.columns:
-    if field == datetime_field:
-        break 
-    elif  iter_no < field_no - 1:
-        iter_no += 1
-        continue
-    else:
-        print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
-        t.sleep(10)
-        exit()
+    field_no = len(target_columns)
+    iter_no = 0
+    for field in target_columns:
+        if field == latitude_field:
+            break 
+        elif  iter_no < field_no - 1:
+            iter_no += 1
+            continue
+        else:
+            print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+            t.sleep(10)
+            exit()
 
-## Elevation field input
-try:
-    print("\nYour Elevation fieldname is: " + elevation_field, end="")
-    elevation_field_input = input("If we have accurately determined the name of your elevation field, please press enter. If not, please type the correct name: ")
-    if elevation_field_input == "" or elevation_field_input == " ":
-        print("Elevation fieldname is now verified.")
-    else:
-        elevation_field = elevation_field_input    
-except NameError:
-    elevation_field_input = input("We could not automatically determine the name of your elevation field. Please state the exact name of the elevation field in your csv/excel file (OPTIONAL, if there is none, leave answer as empty by pressing enter): ")
-    if elevation_field_input == "" or elevation_field_input == " ":
-        elevation_field = ""
-    else:
-        elevation_field = elevation_field_input
+    ## Datetime field input
+    try:
+        print("\nYour Datetime fieldname is: " + datetime_field, end="")
+        datetime_field_input = input("If we have accurately determined the name of your datetime field, please press enter. If not, please type the correct name: ")
+        if datetime_field_input == "" or datetime_field_input == " ":
+            print("Datetime fieldname is now verified.")
+        else:
+            datetime_field = datetime_field_input    
+    except NameError:
+        datetime_field_input = input("We could not automatically determine the name of your datetime field. Please state the exact name of the datetime field in your csv/excel file (MANDATORY and format must be YYYY-MM-DD HH:MM:SS): ")
+        if datetime_field_input == "" or datetime_field_input == " ":
+            print("REMINDER: When running this tool, remember to specify the name of the datetime field according to request above.")
+            t.sleep(10)
+            exit()
+        else:
+            datetime_field = datetime_field_input
     
-field_no = len(target_spreadsheet.columns)
-iter_no = 0
-if elevation_field != "":
-    for field in target_spreadsheet.columns:
-        if field == elevation_field:
+    field_no = len(target_columns)
+    iter_no = 0
+    for field in target_columns:
+        if field == datetime_field:
             break 
         elif  iter_no < field_no - 1:
             iter_no += 1
@@ -177,121 +515,138 @@ if elevation_field != "":
             t.sleep(10)
             exit()
 
+    ## Elevation field input
+    try:
+        print("\nYour Elevation fieldname is: " + elevation_field, end="")
+        elevation_field_input = input("If we have accurately determined the name of your elevation field, please press enter. If not, please type the correct name: ")
+        if elevation_field_input == "" or elevation_field_input == " ":
+            print("Elevation fieldname is now verified.")
+        else:
+            elevation_field = elevation_field_input    
+    except NameError:
+        elevation_field_input = input("We could not automatically determine the name of your elevation field. Please state the exact name of the elevation field in your csv/excel file (OPTIONAL, if there is none, leave answer as empty by pressing enter): ")
+        if elevation_field_input == "" or elevation_field_input == " ":
+            elevation_field = ""
+        else:
+            elevation_field = elevation_field_input
+    
+    field_no = len(target_columns)
+    iter_no = 0
+    if elevation_field != "":
+        for field in target_columns:
+            if field == elevation_field:
+                break 
+            elif  iter_no < field_no - 1:
+                iter_no += 1
+                continue
+            else:
+                print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+                t.sleep(10)
+                exit()
+
+    ## Subject field input
+    subject_field = input("\nIf your file holds the tracks of several subjects (i.e. animals or collars), please state the exact name of the field identifying the subject of each row to save one track per subject (OPTIONAL, if all rows belong to one track, leave answer as empty by pressing enter): ").strip()
+    if subject_field != "" and subject_field not in target_columns:
+        print("REMINDER: Ensure that the fieldname provided above is both typed correctly (Font case sensitive) and the field actually exists in your csv/excel file.")
+        t.sleep(10)
+        exit()
+
+    ## Subject track output input
+    if subject_field != "":
+        track_output = input("Enter 1 to save the tracks of all subjects in one gpx file OR 2 to save the track of each subject in its own gpx file: ").strip()
+        if track_output not in ('1', '2'):
+            print("REMINDER: When running this tool, remember to answer the subject track output question with either 1 or 2.")
+            t.sleep(10)
+            exit()
+
+    ## Track simplification input
+    simplification_mode = input("\nIf your tracks have too many points for your device, enter 1 to simplify them keeping their shape within a tolerance (Douglas-Peucker), 2 to keep one point per time interval OR 3 to keep one point per distance interval (OPTIONAL, if the tracks should keep all their points, leave answer as empty by pressing enter): ").strip()
+    if simplification_mode not in ('', '1', '2', '3'):
+        print("REMINDER: When running this tool, remember to answer the track simplification question with either 1, 2, 3 or by pressing enter.")
+        t.sleep(10)
+        exit()
+    simplification_mode = int(simplification_mode) if simplification_mode != "" else 0
+    if simplification_mode != 0:
+        simplification_unit = "seconds" if simplification_mode == 2 else "metres"
+        try:
+            simplification_value = float(input("Please state the " + ("tolerance" if simplification_mode == 1 else "interval") + " in " + simplification_unit + " (MANDATORY and must be a positive number): "))
+            if not simplification_value > 0:
+                raise ValueError
+        except ValueError:
+            print("REMINDER: When running this tool, remember to specify the " + ("tolerance" if simplification_mode == 1 else "interval") + " of the track simplification as a positive number.")
+            t.sleep(10)
+            exit()
+
 
-#-----------------------------------------------Preparing the environment---------------------------------------------
-os.chdir(pathlib.Path(target_file).parent.absolute())
+    #-----------------------------------------------Preparing the environment---------------------------------------------
+    os.chdir(pathlib.Path(target_file).parent.absolute())
 
 
-#---------------------------Defining custom functions------------------
-def currentSecondsTime():
-    """ Returns the current time in seconds"""
-    return int(t.time())
+    startTime = currentSecondsTime()
 
-def timeTaken(startTime, endTime):
-    """ Returns the difference between a start time and an end time
-        formatted as 00:00:00 """
-    timeTaken = endTime - startTime
-    return str(datetime.timedelta(seconds=timeTaken))
 
-def showPyMessage(message, messageType="Message"):
-    """ Shows a formatted message to the user during processing. """
-    if (messageType == "Message"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
-    if (messageType == "Warning"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
-    if (messageType == "Error"):
-        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
-        print(message)
+    #--------------------------------------------------STEP 1: Creating a table using only the target fields---------------------------------------------
+    print("\nStep 1: Creating a table using only the target fields (" + longitude_field + ", " + latitude_field + ", " + datetime_field + ",...) from your " + target_file_name + " file.")
+    target_fields = [latitude_field, longitude_field, datetime_field] + ([elevation_field] if elevation_field != "" else []) + ([subject_field] if subject_field != "" else [])
+    target_spreadsheet = loadTargetFields(target_file, target_fields)
+    extracted_csv = pd.DataFrame()
+    extracted_csv["Latitude"] = target_spreadsheet[latitude_field].astype(str).str.replace(",", ".", regex=False)
+    extracted_csv["Longitude"] = target_spreadsheet[longitude_field].astype(str).str.replace(",", ".", regex=False)
+    extracted_csv["Datetime"] = normalizeDatetimes(target_spreadsheet[datetime_field])
+    if elevation_field == "":
+        extracted_csv["Elevation"] = 0.999999999
+    elif elevation_field != "":
+        extracted_csv["Elevation"] = target_spreadsheet[elevation_field].astype(float)
+    if subject_field != "":
+        extracted_csv[subject_field] = target_spreadsheet[subject_field]
+        extracted_csv, subject_names, subject_starts = sortBySubject(extracted_csv, subject_field)
 
 
-startTime = currentSecondsTime()
+    #--------------------------------------------------STEP 2: Simplifying the tracks---------------------------------------------
+    if simplification_mode == 0:
+        print("\nStep 2: Keeping all the points of the tracks.")
+    else:
+        print("\nStep 2: Simplifying the tracks with a " + ["Douglas-Peucker tolerance", "time interval", "distance interval"][simplification_mode - 1] + " of " + str(simplification_value) + " " + simplification_unit + ".")
+        track_starts = subject_starts if subject_field != "" else np.array([0])
+        if len(extracted_csv) > 0:
+            kept_points = simplifyTracks(extracted_csv, simplification_mode, simplification_value, track_starts)
+            kept_rows = np.flatnonzero(kept_points)
+            print("Kept " + str(len(kept_rows)) + " of " + str(len(extracted_csv)) + " points, a reduction of " + "{:.1%}".format(1 - len(kept_rows) / len(extracted_csv)) + ".")
+            extracted_csv = extracted_csv.iloc[kept_rows].reset_index(drop=True)
+            if subject_field != "":
+                subject_starts = np.searchsorted(kept_rows, subject_starts)
+
+
+    #--------------------------------------------------STEP 3: Saving the extracted table as gpx file format---------------------------------------------
+    if subject_field == "":
+        print("\nStep 3: Saving the extracted table as gpx file format.")
+    else:
+        print("\nStep 3: Saving the extracted table as gpx file format, with one track for each of the " + str(len(subject_names)) + " subjects in the " + subject_field + " field.")
+
+    if target_file[-4] == ".":
+        extracted_csv_file_name = target_file[:-4] + "_extract.csv"
+        extracted_csv.to_csv(extracted_csv_file_name)
+        gpx_file_name = target_file[:-4] + ".gpx"
+    elif target_file[-5] == ".":
+        extracted_csv_file_name = target_file[:-5] + "_extract.csv"
+        extracted_csv.to_csv(extracted_csv_file_name)
+        gpx_file_name = target_file[:-5] + ".gpx"
+
+    #Write the standard elements and then the trkpt elements block by block
+    if subject_field == "":
+        writeGpxFile(gpx_file_name.replace(' ', '_'), splitIntoBlocks(extracted_csv, gpx_block_size))
+    else:
+        subject_file_names = None
+        if track_output == '2':
+            subject_file_names = subjectFileNames(gpx_file_name.replace(' ', '_'), subject_names)
+            for subject_name, subject_file_name in zip(subject_names, subject_file_names):
+                if subject_file_name != subjectFileName(gpx_file_name.replace(' ', '_'), subject_name):
+                    print("The file name of subject " + str(subject_name) + " is shared with another subject, its track is saved as " + os.path.basename(subject_file_name) + ".")
+        writeSubjectTracks(gpx_file_name.replace(' ', '_'), extracted_csv, subject_names, subject_starts, subject_file_names)
 
+    endTime = currentSecondsTime()
 
-#--------------------------------------------------STEP 1: Creating a table using only the target fields---------------------------------------------
-print("\nStep 1: Creating a table using only the target fields (" + longitude_field + ", " + latitude_field + ", " + datetime_field + ",...) from your " + target_file_name + " file.")
-extracted_csv = pd.DataFrame()
-extracted_csv["Latitude"] = target_spreadsheet[latitude_field]
-extracted_csv["Longitude"] = target_spreadsheet[longitude_field]
-extracted_csv["Datetime"] = target_spreadsheet[datetime_field]
-if elevation_field == "":
-    extracted_csv["Elevation"] = 0.999999999
-elif elevation_field != "":
-    extracted_csv["Elevation"] = target_spreadsheet[elevation_field]
 
-for index, row in extracted_csv.iterrows():
-    datetime_value = str(row["Datetime"])
-    if len(datetime_value.split()) > 1:
-        date = datetime_value.split()[0]
-        time = datetime_value.split()[1]
-        try:
-            if int(date[-4:]) > 1900 and date[-5:-4] == "/":
-                day = date.split("/")[0]
-                month = date.split("/")[1]
-                year = date.split("/")[2]
-                date = year + "-" + month + "-" + day
-        except:
-            continue
-        hour = time.split(":")[0]
-        minutes = time.split(":")[1]
-        if len(time) < 6:
-            time = hour + ":" + minutes + ":00"
-        extracted_csv.loc[index, "Datetime"]= date + "T" + time + "Z"
-
-for index, row in extracted_csv.iterrows():
-    if re.search(',', str(row["Latitude"])):
-        extracted_csv.loc[index, "Latitude"] = row["Latitude"].replace(",", ".")
-        extracted_csv.loc[index, "Longitude"] = row["Longitude"].replace(",", ".")
-
-for index, row in extracted_csv.iterrows():
-    extracted_csv.loc[index, "Latitude"] = str(row["Latitude"])
-    extracted_csv.loc[index, "Longitude"] = str(row["Longitude"])    
-    if elevation_field != "":
-        extracted_csv.loc[index, "Elevation"] = float(row["Elevation"])
-
-
-#--------------------------------------------------STEP 2: Saving the extracted table as gpx file format---------------------------------------------
-print("\nStep 2: Saving the extracted table as gpx file format.")
-
-if target_file[-4] == ".":
-    extracted_csv_file_name = target_file[:-4] + "_extract.csv"
-    extracted_csv.to_csv(extracted_csv_file_name)
-    gpx_file_name = target_file[:-4] + ".gpx"
-elif target_file[-5] == ".":
-    extracted_csv_file_name = target_file[:-5] + "_extract.csv"
-    extracted_csv.to_csv(extracted_csv_file_name)
-    gpx_file_name = target_file[:-5] + ".gpx"
-
-#The standard elements
-gpx = ET.Element("gpx")
-gpx.set("xmlns:xsi","http://www.w3.org/2001/XMLSchema-instance")
-gpx.set("xmlns","http://www.topografix.com/GPX/1/1")
-gpx.set("xsi:schemaLocation","http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd")
-gpx.set("version","1.1")
-gpx.set("creator","Open GPX Tracker for iOS")
-trk = ET.SubElement(gpx, "trk")
-trkseg = ET.SubElement(trk, "trkseg")
-
-#Write trkpt attributes and subelement text
-row_number = len(extracted_csv["Latitude"])
-element_no = 0
-for record in extracted_csv["Longitude"]:
-    trkpt = ET.SubElement(trkseg, "trkpt")
-    trkpt.set("lon",extracted_csv["Longitude"][element_no])
-    trkpt.set("lat",extracted_csv["Latitude"][element_no])
-    ele = ET.SubElement(trkpt, "ele")
-    time = ET.SubElement(trkpt, "time")
-    ele.text = str(extracted_csv["Elevation"][element_no])
-    time.text =  str(extracted_csv["Datetime"][element_no])
-    element_no += 1
-
-tree = ET.ElementTree(gpx)
-tree.write(gpx_file_name.replace(' ', '_'),encoding="UTF-8",xml_declaration='<?xml version="1.0" encoding="UTF-8"?>')
-
-endTime = currentSecondsTime()
-
-
-# --------------------------- End of Process ---------------------------
-print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
-showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
+    # --------------------------- End of Process ---------------------------
+    print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
+    showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
@@ -17,46 +17,36 @@ print("""\nReminder - For this tool to execute successfully, your machine needs:
 
                                                                    
 #---------------------------------------Import Libraries----------------------------------------------------------------------
+import concurrent.futures
 import datetime
+import getpass
+import numpy as np
 import os
 import pandas as pd
 import pathlib
+import re
 import requests
+import threading
 import time as t
 import uuid
+from requests.adapters import HTTPAdapter
 
 
 #---------------------------------------Declaring Input Data----------------------------------------------------------------------
-## cURL contents
-print("""\n\n\n6 Instructions for the FIRST TIME you run this script:
-      \n\t 1)From your Google Chrome web browser, please go to the ER site that you want to load your choices into.Then go to the Add choice page.
-      \n\t 2) With the Network tab of the Developer Tools open, manually add the FIRST CHOICE in your choices.csv file.
-      \n\t 3) In your Network tab of the Developer Tools, find the request call 'add/' and then right click it and Copy as cURL(bash).
-      \n\t 4) Paste the copied cURL contents into a text file, and then use this copied content to update the headers dictionary in this python script.
-      \n\t 5) Use the copied cURL contents to also update the csrfmiddlewaretoken  and site address values in this python script (you will find this cURL information in the --data-raw element in your cURL text file).
-      \n\t 6) NB: Remember to stop this script, and then save this script and then RERUN it again so that your updated headers and values can be used by this script.""")
-                                                                   
-## Use the copied cURL contents to update the headers dictionary below                                                                   
-headers = {
-    'authority': 'sabisands.pamdas.org',
-    'cache-control': 'max-age=0',
-    'upgrade-insecure-requests': '1',
-    'origin': 'https://sabisands.pamdas.org',
-    'content-type': 'application/x-www-form-urlencoded',
-    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.150 Safari/537.36',
-    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-    'sec-fetch-site': 'same-origin',
-    'sec-fetch-mode': 'navigate',
-    'sec-fetch-user': '?1',
-    'sec-fetch-dest': 'document',
-    'referer': 'https://sabisands.pamdas.org/admin/choices/choice/add/',
-    'accept-language': 'en-US,en;q=0.9',
-    'cookie': '_ga=GA1.2.989508353.1607494565; OptanonAlertBoxClosed=2021-01-29T13:40:46.598Z; csrftoken=3SojWmdzIEKoNbL8XIZ09gtdpvL8dqkIASu2isWjLCMcmFwmu9wkFhWtX0iyBeh4; sessionid=89etb37ust7gp6il9knbs819os16qetp; _gid=GA1.2.1155336314.1613113021; token=3CoI4Tlfb9cKnrc8nYujUjTVdkJHrU; OptanonConsent=isIABGlobal=false&datestamp=Fri+Feb+12+2021+12%3A56%3A05+GMT%2B0200+(South+Africa+Standard+Time)&version=6.12.0&hosts=&consentId=c7b3223c-3aad-4322-8ce0-a5adfa1a21a7&interactionCount=1&landingPath=NotLandingPage&groups=C0001%3A1%2CC0002%3A1&geolocation=ZA%3BGP&AwaitingReconsent=false',
-}
-
-## Use the previously copied cURL contents to update the csrfmiddlewaretoken and site address values below (you will find this information in the --data-raw element in the cURL contents)
-csrfmiddlewaretoken = 'YJc45qQNcSTLNzjwKsB8ipnWTemLia4IvJiNrwzxfQVzm34KhT8sOqQcrJTbGY14'
-site_address = 'https://sabisands.pamdas.org'
+## ER site address and upload settings
+site_address = 'https://sabisands.pamdas.org'     ## The address of the ER site that you want to load your choices into
+upload_worker_count = 4       ## Number of choices being posted to the ER site at the same time
+request_timeout = 30          ## Seconds to wait for the ER site to answer a request
+max_text_lengths = {'field': 100, 'value': 100, 'display': 100}     ## Longest field, value and display text the Add choice form accepts, longer choices are not posted
+bad_character_pattern = '[\x00-\x1f\x7f\ufffd]'     ## Control characters and undecodable bytes, choices holding them are not posted
+
+## Login details of a user allowed to add choices from the admin pages of the ER site
+username = input("\n\n\nUsername of your ER site admin account (MANDATORY): ")
+password = getpass.getpass("Password of your ER site admin account (MANDATORY): ")
+if username == "" or password == "":
+    print("REMINDER: When running this tool, remember to specify the username and password of your ER site admin account according to request above.")
+    t.sleep(10)
+    exit()
 
 
 ## Choice.csv input
@@ -70,7 +60,6 @@ if not os.path.isfile(csv_file):
     t.sleep(10)
     exit()
 
-csv_df = pd.read_csv(csv_file, names = ['field', 'value', 'display', 'ordernum'])   # Load the csv input file
 
 
 #-----------------------------------------------Preparing the environment---------------------------------------------
@@ -100,34 +89,163 @@ def showPyMessage(message, messageType="Message"):
         os.system('echo ' + str(t.ctime()) + " - " + message + "'")
         print(message)
 
+def loadChoicesCsv(csv_file):
+    """ Loads the choices.csv file as text, trying UTF-8 first and then the
+        Windows-1252 encoding used by Excel. """
+    for encoding in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            return pd.read_csv(csv_file, names = ['field', 'value', 'display', 'ordernum'], usecols = range(4), dtype=str, keep_default_na=False, encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+
+def checkChoiceRows(choice_Rows):
+    """ Tidies the text of the choice rows (unicode NFC, no non-breaking or
+        surrounding spaces) and sets aside, before anything is posted, the
+        rows the Add choice form would refuse and the repeats of an earlier
+        (field, value) pair. Returns the rows to post, with whole number
+        ordernums, and the rows set aside with their csv line and reason. """
+    choice_Rows = choice_Rows.fillna('').apply(lambda column: column.str.normalize('NFC').str.replace('\u00a0', ' ').str.strip())
+    ordernums = pd.to_numeric(choice_Rows['ordernum'], errors='coerce')
+    text_lengths = choice_Rows[list(max_text_lengths)].apply(lambda column: column.str.len())
+    reasons = pd.Series(np.select(
+        [choice_Rows.apply(lambda column: column.str.contains(bad_character_pattern)).any(axis=1),
+         choice_Rows[['field', 'value', 'display']].eq('').any(axis=1),
+         ordernums.isna() | (ordernums % 1 != 0),
+         text_lengths.gt(pd.Series(max_text_lengths)).any(axis=1)],
+        ['bad characters', 'missing field, value or display', 'missing or non-whole ordernum', 'over-long text'], default=''), index=choice_Rows.index)
+    reasons = reasons.mask(choice_Rows[reasons == ''].duplicated(['field', 'value']).reindex(reasons.index, fill_value=False), 'duplicate (field, value)')
+    rejected_Rows = choice_Rows[reasons != ''].assign(reason=reasons[reasons != ''])
+    rejected_Rows.insert(0, 'csv_line', rejected_Rows.index + 1)
+    return choice_Rows[reasons == ''].assign(ordernum=ordernums[reasons == ''].astype('int64')), rejected_Rows
+
+csrf_lock = threading.Lock()
+csrf_state = {'token': None}     ## The csrf token of the Add choice form, shared by all the upload threads
+
+def adminSession():
+    """ Returns a session whose connections to the ER site are kept alive and
+        shared by all the upload threads. """
+    session = requests.Session()
+    session.mount(site_address, HTTPAdapter(pool_connections=1, pool_maxsize=upload_worker_count))
+    session.headers.update({'origin': site_address, 'referer': site_address + '/admin/choices/choice/add/'})
+    return session
+
+def pageCsrfToken(page_text):
+    """ Returns the csrfmiddlewaretoken of the form of an admin page, or None. """
+    token_match = re.search(r'name=["\']csrfmiddlewaretoken["\'] value=["\']([^"\']+)', page_text)
+    return token_match.group(1) if token_match else None
+
+def logIn(session, username, password):
+    """ Logs into the admin pages of the ER site once, leaving the session and
+        csrf cookies in the session. Returns True if the login succeeded. """
+    login_page = session.get(site_address + '/admin/login/', params={'next': '/admin/'}, timeout=request_timeout)
+    login_page.raise_for_status()
+    data = {
+      'csrfmiddlewaretoken': pageCsrfToken(login_page.text) or session.cookies.get('csrftoken', ''),
+      'username': username,
+      'password': password,
+      'next': '/admin/'
+    }
+    response = session.post(site_address + '/admin/login/?next=/admin/', data=data, headers={'referer': login_page.url}, allow_redirects=False, timeout=request_timeout)
+    return response.status_code == 302 and 'sessionid' in session.cookies
+
+def refreshCsrfToken(session, rejected_token=None):
+    """ Fetches the csrf token of the Add choice form, the first time or after
+        the ER site rejected the current one, unless another upload thread
+        has already done so. The token of the form is used, or the csrftoken
+        cookie if the page has none. Returns the current token. """
+    with csrf_lock:
+        if csrf_state['token'] == rejected_token:
+            response = session.get(site_address + '/admin/choices/choice/add/', timeout=request_timeout)
+            response.raise_for_status()
+            csrf_state['token'] = pageCsrfToken(response.text) or session.cookies.get('csrftoken', '')
+        return csrf_state['token']
+
+def postChoiceForm(session, choice_Row):
+    """ Posts one choice through the Add choice form of the ER site, fetching
+        a new csrf token and posting again once if the token was rotated.
+        Returns the http code of the response, or the error which prevented
+        the request from being answered. """
+    try:
+        csrf_token = csrf_state['token'] or refreshCsrfToken(session)
+        for attempt in range(2):
+            # generating UUID for choice id
+            choice_id = str(uuid.uuid4())
+            # compiling the data
+            data = {
+              'csrfmiddlewaretoken': csrf_token,
+              'id': choice_id,
+              'initial-id': choice_id,
+              'model': 'activity.event',
+              'field': choice_Row.field,
+              'value': choice_Row.value,
+              'display': choice_Row.display,
+              'icon': '',
+              'ordernum': choice_Row.ordernum,
+              '_save': 'Save'
+            }
+            # sending the request
+            response = session.post(site_address + '/admin/choices/choice/add/', data=data, allow_redirects=False, timeout=request_timeout)
+            if response.status_code != 403 or attempt == 1:
+                break
+            csrf_token = refreshCsrfToken(session, csrf_token)
+    except requests.RequestException as error:
+        return type(error).__name__
+    # the admin redirects to the choice list once a choice is saved, and back to the login page if the session expired
+    if response.status_code == 302 and '/admin/login/' not in response.headers.get('location', ''):
+        return 201
+    return response.status_code
+
+def uploadChoiceForms(session, choice_Rows):
+    """ Posts the choices through a pool of upload threads sharing one
+        logged in session, and reports every result as soon as it arrives.
+        Returns the problem rows, each starting with the http code or error
+        it received. """
+    problem_Rows = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=upload_worker_count) as executor:
+        uploads = {executor.submit(postChoiceForm, session, choice_Row): choice_Row for choice_Row in choice_Rows.itertuples(index=False)}
+        for upload in concurrent.futures.as_completed(uploads):
+            choice_Row = uploads[upload]
+            status_code = upload.result()
+            if status_code != 201:
+                print("\n WARNING: Request returned the http code {0} whilst sending row: {1}.".format(str(status_code), str(list(choice_Row))))
+                problem_Rows.append([status_code] + list(choice_Row))
+            else:
+                print("Imported:", str(list(choice_Row)))
+    return problem_Rows
+
 
 startTime = currentSecondsTime()
 
 #--------------------------------------------------STEP: Uploading choices into your chosen ER Site---------------------------------------------
 print("\n STEP: Uploading choices into your chosen ER Site.")
 
-for choice_Index, choice_Row in csv_df[1:].iterrows():
-    # generating UUID for choice id
-    choice_id = str(uuid.uuid4())
-    # compiling the data
-    data = {
-      'csrfmiddlewaretoken': csrfmiddlewaretoken,
-      'id': choice_id,
-      'initial-id': choice_id,
-      'model': 'activity.event',
-      'field': choice_Row.field,
-      'value': choice_Row.value,
-      'display': choice_Row.display,
-      'icon': '',
-      'ordernum': choice_Row.ordernum,
-      '_save': 'Save'
-    }
-    # sending the request
-    response = requests.post(site_address + '/admin/choices/choice/add/', headers=headers, data=data)   
+csv_df, rejected_df = checkChoiceRows(loadChoicesCsv(csv_file)[1:])   # Load the csv input file (without its header row) and check its rows
+print(" VALIDATION: {0} rows read, {1} invalid rows rejected and {2} duplicate rows removed, avoiding {3} requests.".format(len(csv_df) + len(rejected_df), int((rejected_df['reason'] != 'duplicate (field, value)').sum()), int((rejected_df['reason'] == 'duplicate (field, value)').sum()), len(rejected_df)))
+if len(rejected_df) > 0:
+    rejected_df.to_csv('./Rejected_ChoiceRows.csv', index=False)
+    print(" VALIDATION: The rejected rows are listed in the Rejected_ChoiceRows.csv file in the directory of your csv file.")
+
+session = adminSession()
+try:
+    logged_in = logIn(session, username, password)
+except requests.RequestException as error:
+    print("REMINDER: Ensure that the site address in this python script is typed correctly and the ER site can be reached (" + str(error) + ").")
+    t.sleep(10)
+    exit()
+if not logged_in:
+    print("REMINDER: Ensure that the username and password typed above are correct and belong to an ER site admin account.")
+    t.sleep(10)
+    exit()
+
+problem_Rows = uploadChoiceForms(session, csv_df)
 
 
 endTime = currentSecondsTime()
 
 # --------------------------- End of Process ---------------------------
-print("\n\n Choices uploaded.")
+if len(problem_Rows) == 0:
+    print("\n\n Choices uploaded.")
+else:
+    pd.DataFrame(problem_Rows).to_csv('./POTENTIALLY_Problematic_ChoiceRows.csv', index=False)
+    print("\n\n Choices uploaded, but {} choice(s) were not saved. Please refer to the POTENTIALLY_Problematic_ChoiceRows.csv file in the directory of your csv file.".format(len(problem_Rows)))
 showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
@@ -19,7 +19,9 @@ print("""\nReminder - For this tool to execute successfully, your machine needs:
 
                                                                    
 #---------------------------------------Import Libraries----------------------------------------------------------------------
-import json, requests, pandas as pd, time
+import argparse, concurrent.futures, csv, datetime, json, os, random, requests, numpy as np, pandas as pd, threading, time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 
 #---------------------------------------Defining variables----------------------------------------------------------------------
@@ -27,8 +29,32 @@ import json, requests, pandas as pd, time
 ER_site_url_name = 'easterisland'     ## Just the name part of the ER site URL (https://easterisland.pamdas.org/)
 auth_token = '2cw697Qb-F066-4dB8-a669-c63666639gff'
 csv_file = './choices.csv'
+ER_site_url = 'https://{}.pamdas.org'.format(ER_site_url_name)     ## The ER site address, which can be pointed to a local test server (i.e. 'http://localhost:8000')
 
-choices_csv = pd.read_csv(csv_file, header=None)
+# Upload settings
+upload_worker_count = 8       ## Number of choices being sent to the ER site at the same time
+requests_per_second = 10      ## Highest number of requests sent to the ER site per second
+request_timeout = 30          ## Seconds to wait for the ER site to answer a request
+max_retries = 5               ## Number of times a request is sent again after a transient failure (http codes 429 and 5xx, timeouts and lost connections)
+backoff_base = 1.0            ## Seconds of the longest wait before the first retry, doubled for every next retry
+backoff_cap = 60.0            ## Seconds of the longest wait before any retry
+journal_file = './choices_import_journal.csv'     ## Record of the outcome of every choice sent, used to resume an interrupted import (run this script with --resume)
+
+# Sync settings
+sync_with_site = True         ## True to only create the choices missing from the ER site and update the ones whose display or ordernum changed, False to send every row
+choices_page_size = 1000      ## Number of existing choices fetched from the ER site per request
+snapshot_file = './{}_choices_snapshot.json'.format(ER_site_url_name)     ## Local copy of the existing choices of the ER site, reused between runs
+snapshot_max_age = 3600       ## Seconds during which the local copy of the existing choices is reused instead of fetching them again (0 to always fetch them)
+
+# Validation settings
+max_text_lengths = {'field': 100, 'value': 100, 'display': 100}     ## Longest field, value and display text accepted, longer rows are rejected before any request is sent
+bad_character_pattern = '[\x00-\x1f\x7f\ufffd]'     ## Characters for which rows are rejected before any request is sent (control characters and undecodable bytes)
+rejected_rows_file = './Rejected_ChoiceRows.csv'     ## Rows rejected by the validation of the choices.csv file, with the reason for their rejection
+
+# Command line options
+parser = argparse.ArgumentParser(description="Imports the field choices of event types from a choices.csv file.")
+parser.add_argument('--resume', action='store_true', help="skip the choices already imported or updated according to the journal of a previous run")
+arguments = parser.parse_args()
 
 
 # Headers
@@ -39,33 +65,306 @@ headers = {
 }
 
 
-problem_rows_table = pd.DataFrame()
+
+#---------------------------------------Defining custom functions----------------------------------------------------------------------
+thread_sessions = threading.local()
+rate_limit_lock = threading.Lock()
+next_request_time = 0.0
+
+def getSession():
+    """ Returns the keep-alive session of the current upload thread, which
+        reuses its connection to the ER site for every request it sends. """
+    if not hasattr(thread_sessions, 'session'):
+        session = requests.Session()
+        session.headers.update(headers)
+        session.mount(ER_site_url, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        thread_sessions.session = session
+    return thread_sessions.session
+
+def waitForRequestSlot():
+    """ Blocks until the next request may be sent, spacing the requests of
+        all upload threads so that no more than requests_per_second are sent. """
+    global next_request_time
+    with rate_limit_lock:
+        request_time = max(time.monotonic(), next_request_time)
+        next_request_time = request_time + 1.0 / requests_per_second
+    time.sleep(max(0.0, request_time - time.monotonic()))
+
+def responseChoice(response):
+    """ Returns the choice held in the json answer of the ER site, or None. """
+    try:
+        content = response.json()
+    except ValueError:
+        return None
+    choice = content.get('data', content) if isinstance(content, dict) else None
+    return choice if isinstance(choice, dict) else None
+
+def requestNeverSent(error):
+    """ Returns True if a request failed before reaching the ER site (the
+        connection timed out or was refused), so that sending it again cannot
+        create a choice twice. """
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+def sendRequest(method, url, **request_arguments):
+    """ Sends a request to the ER site through the session of the current
+        thread. Transient failures (http codes 429 and 5xx, timeouts and lost
+        connections) are retried up to max_retries times after a random wait
+        of up to backoff_base seconds doubled at every retry (or the wait the
+        ER site asks for). As creating a choice twice is not harmless, a POST
+        is only retried when it never reached the ER site or was turned away
+        with the http code 429 or 503. Returns the last response or raises
+        the last error. """
+    idempotent = method != 'POST'
+    for attempt in range(max_retries + 1):
+        waitForRequestSlot()
+        retry_after = 0.0
+        try:
+            response = getSession().request(method, url, timeout=request_timeout, **request_arguments)
+        except (requests.Timeout, requests.ConnectionError) as error:
+            if attempt == max_retries or not (idempotent or requestNeverSent(error)):
+                raise
+        else:
+            transient = response.status_code == 429 or (response.status_code >= 500 if idempotent else response.status_code == 503)
+            if not transient or attempt == max_retries:
+                return response
+            try:
+                retry_after = float(response.headers.get('Retry-After', 0))
+            except ValueError:
+                retry_after = 0.0
+        time.sleep(max(retry_after, random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))))
+
+def postChoice(row_array, choice_id=None):
+    """ Sends one choice to the choices endpoint of the ER site, creating it
+        or, given the id of an existing choice, updating its display and
+        ordernum. Returns the http code of the response, or the error which
+        prevented the request from being answered, the choice returned by the
+        ER site, and whether a new choice may have been created although no
+        answer was received (i.e. after a read timeout). """
+    data_dict = { "model": "activity.event", "field": row_array[0], "value": row_array[1], "display": row_array[2], "ordernum": row_array[3], "is_active": True}
+    try:
+        if choice_id is None:
+            response = sendRequest('POST', ER_site_url + '/api/v1.0/choices/', data=json.dumps(data_dict))
+        else:
+            response = sendRequest('PATCH', ER_site_url + '/api/v1.0/choices/{}/'.format(choice_id), data=json.dumps({"display": row_array[2], "ordernum": row_array[3]}))
+    except requests.RequestException as error:
+        return type(error).__name__, None, choice_id is None and not requestNeverSent(error)
+    return response.status_code, responseChoice(response), False
+
+def openJournal(resume):
+    """ Opens the journal for appending the outcomes of this run, starting a
+        new journal unless an interrupted import is resumed. """
+    new_journal = not resume or not os.path.isfile(journal_file)
+    journal = open(journal_file, 'w' if new_journal else 'a', newline='', encoding='UTF-8')
+    if new_journal:
+        csv.writer(journal).writerow(['time', 'outcome', 'status', 'field', 'value', 'display', 'ordernum'])
+        journal.flush()
+    return journal
+
+def journalOutcome(journal, outcome, status_code, row_array):
+    """ Appends the outcome of one choice to the journal and writes it to
+        disk at once, so that it survives an interruption of the import. """
+    csv.writer(journal).writerow([datetime.datetime.now().isoformat(timespec='seconds'), outcome, status_code] + row_array)
+    journal.flush()
+
+def rowKey(row_array):
+    """ Returns the text of the values of a choice row as written in the
+        journal, to recognise the rows already confirmed. """
+    return tuple('' if value is None else str(value) for value in row_array)
+
+def confirmedRows():
+    """ Returns the keys of the choice rows that the journal records as
+        imported or updated. """
+    if not os.path.isfile(journal_file):
+        return set()
+    journal_table = pd.read_csv(journal_file, dtype=str, keep_default_na=False)
+    confirmed_table = journal_table[journal_table['outcome'].isin(['imported', 'updated'])]
+    return set(confirmed_table[['field', 'value', 'display', 'ordernum']].itertuples(index=False, name=None))
+
+def uploadChoices(choice_rows, choice_ids=None, journal=None):
+    """ Sends the choices through a pool of upload threads and reports every
+        result as soon as it arrives, recording it in the journal when one is
+        given. Rows given a choice id update that choice. Returns the problem
+        rows, each starting with the http code or error it received, and the
+        choices the ER site returned (without an id when unconfirmed). """
+    failed_rows = []
+    sent_choices = []
+    choice_ids = choice_ids if choice_ids is not None else [None] * len(choice_rows)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=upload_worker_count) as executor:
+        uploads = {executor.submit(postChoice, row_array, choice_id): (row_array, choice_id) for row_array, choice_id in zip(choice_rows, choice_ids)}
+        for upload in concurrent.futures.as_completed(uploads):
+            row_array, choice_id = uploads[upload]
+            status_code, site_choice, unconfirmed = upload.result()
+            if unconfirmed:
+                print("\n\n\n WARNING: No answer was received ({0}) whilst sending row: {1}. The choice may have been created, so it is not sent again and will be checked against your ER site in the next run\n\n\n".format(str(status_code), str(row_array)))
+                failed_rows.append([status_code] + row_array)
+                if journal is not None:
+                    journalOutcome(journal, 'unconfirmed', status_code, row_array)
+                # without an id the snapshot is dropped, so the next run fetches this choice if it was created
+                sent_choices.append({"id": None, "model": "activity.event", "field": row_array[0], "value": row_array[1], "display": row_array[2], "ordernum": row_array[3]})
+            elif status_code != (201 if choice_id is None else 200):
+                print("\n\n\n WARNING: Request returned the http code {0} whilst sending row: {1}. Please check your user-defined inputs in this script and/or your choices.csv file\n\n\n".format(str(status_code), str(row_array)))
+                failed_rows.append([status_code] + row_array)
+                if journal is not None:
+                    journalOutcome(journal, 'failed', status_code, row_array)
+            else:
+                print("Imported:" if choice_id is None else "Updated:", str(row_array))
+                if journal is not None:
+                    journalOutcome(journal, 'imported' if choice_id is None else 'updated', status_code, row_array)
+                sent_choices.append(dict(site_choice or {}, id=(site_choice or {}).get('id', choice_id), model="activity.event", field=row_array[0], value=row_array[1], display=row_array[2], ordernum=row_array[3]))
+    return failed_rows, sent_choices
+
+def fetchSiteChoices():
+    """ Fetches all the existing choices of the ER site in bulk, following
+        the pages of the choices endpoint. """
+    site_choices = []
+    url = ER_site_url + '/api/v1.0/choices/'
+    params = {'page_size': choices_page_size}
+    while url:
+        response = sendRequest('GET', url, params=params)
+        response.raise_for_status()
+        content = response.json()
+        data = content.get('data', content) if isinstance(content, dict) else content
+        if isinstance(data, dict):
+            site_choices.extend(data.get('results', []))
+            url = data.get('next')
+            params = None # the next page address already holds the query
+        else:
+            site_choices.extend(data)
+            url = None
+    return site_choices
+
+def loadSiteChoices():
+    """ Returns the existing choices of the ER site and the time they were
+        fetched, from the local snapshot while it is recent enough and was
+        taken from the same ER site address, or else from the ER site. """
+    if snapshot_max_age > 0 and os.path.isfile(snapshot_file):
+        try:
+            with open(snapshot_file, 'r', encoding='UTF-8') as snapshot:
+                snapshot_content = json.load(snapshot)
+            # a snapshot taken from another ER site address is never reused
+            if snapshot_content.get('site') == ER_site_url and time.time() - snapshot_content['fetched'] < snapshot_max_age:
+                return snapshot_content['choices'], snapshot_content['fetched']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass # unreadable snapshot, the choices are fetched again
+    return fetchSiteChoices(), time.time()
+
+def saveSiteChoices(site_choices, fetched):
+    """ Saves the existing choices of the ER site as the local snapshot. """
+    temporary_snapshot_file = snapshot_file + '.tmp'
+    with open(temporary_snapshot_file, 'w', encoding='UTF-8') as snapshot:
+        json.dump({'site': ER_site_url, 'fetched': fetched, 'choices': site_choices}, snapshot)
+    os.replace(temporary_snapshot_file, snapshot_file)
+
+def ordernumsDiffer(local_ordernums, site_ordernums):
+    """ Returns which ordernums differ, comparing them as numbers so that 3,
+        3.0 and '3' are equal, and as text when either is not a number. """
+    local_numbers = pd.to_numeric(local_ordernums, errors='coerce').astype('Float64')
+    site_numbers = pd.to_numeric(site_ordernums, errors='coerce').astype('Float64')
+    both_numbers = (local_numbers.notna() & site_numbers.notna()).to_numpy(dtype=bool)
+    numbers_differ = (local_numbers != site_numbers).fillna(True).to_numpy(dtype=bool)
+    texts_differ = (local_ordernums.astype(object).where(local_ordernums.notna(), '').astype(str) != site_ordernums.astype(object).where(site_ordernums.notna(), '').astype(str)).to_numpy()
+    return np.where(both_numbers, numbers_differ, texts_differ)
+
+def readChoicesCsv(csv_file):
+    """ Reads every cell of the choices.csv file as text, decoding it as UTF-8
+        (with or without a byte order mark) or else as Windows-1252, the
+        encoding Excel saves csv files with. """
+    for encoding in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            return pd.read_csv(csv_file, header=None, dtype=str, keep_default_na=False, encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+
+def validateChoices(choices_table):
+    """ Checks all the choice rows at once before any request is sent. The
+        text is normalised (unicode NFC, no non-breaking or surrounding
+        spaces), rows with bad characters, empty text, a missing or
+        non-whole ordernum or over-long text are rejected, and only the
+        first valid row of every (field, value) pair is kept. Returns the
+        valid rows, with whole number ordernums, and the rejected rows with
+        their csv line and the reason for their rejection. """
+    choice_columns = ['field', 'value', 'display', 'ordernum']
+    text_table = choices_table.iloc[:, :4].set_axis(choice_columns[:min(4, choices_table.shape[1])], axis=1).reindex(columns=choice_columns, fill_value='').fillna('').astype(str)
+    text_table = text_table.apply(lambda column: column.str.normalize('NFC').str.replace('\u00a0', ' ').str.strip())
+    ordernums = pd.to_numeric(text_table['ordernum'], errors='coerce')
+    text_lengths = text_table[list(max_text_lengths)].apply(lambda column: column.str.len())
+    reasons = pd.Series(np.select(
+        [text_table.eq(choice_columns).all(axis=1),
+         text_table.apply(lambda column: column.str.contains(bad_character_pattern)).any(axis=1),
+         text_table[['field', 'value', 'display']].eq('').any(axis=1),
+         ordernums.isna() | (ordernums % 1 != 0),
+         text_lengths.gt(pd.Series(max_text_lengths)).any(axis=1)],
+        ['header row', 'bad characters', 'missing field, value or display', 'missing or non-whole ordernum', 'over-long text'], default=''), index=text_table.index)
+    duplicates = text_table[reasons == ''].duplicated(['field', 'value']).reindex(text_table.index, fill_value=False)
+    reasons = reasons.mask(duplicates, 'duplicate (field, value)')
+    valid = reasons == ''
+    valid_table = text_table[valid].assign(ordernum=ordernums[valid].astype('int64').astype(object))
+    rejected_table = text_table[~valid].assign(reason=reasons[~valid])
+    rejected_table.insert(0, 'csv_line', rejected_table.index + 1)
+    return valid_table, rejected_table
+
+def planChoiceSync(choice_rows, site_choices):
+    """ Compares the choices.csv rows with the existing event choices of the
+        ER site, keyed by (field, value). Returns the rows to create, the rows
+        to update with the ids of their choices, and the number of unchanged
+        rows. """
+    local_table = pd.DataFrame(choice_rows, columns=['field', 'value', 'display', 'ordernum'])
+    site_table = pd.DataFrame(site_choices, columns=['id', 'model', 'field', 'value', 'display', 'ordernum'])
+    site_table = site_table[site_table['model'].fillna('activity.event') == 'activity.event']
+    site_table = site_table.astype({'field': str, 'value': str}).drop_duplicates(['field', 'value'], keep='last')
+    local_table['row_number'] = range(len(local_table))
+    merged_table = local_table.astype({'field': str, 'value': str}).merge(site_table.drop(columns='model'), on=['field', 'value'], how='left', suffixes=('', '_site'), indicator=True)
+    missing = (merged_table['_merge'] == 'left_only').to_numpy()
+    changed = ~missing & ((merged_table['display'].astype(str) != merged_table['display_site'].astype(str)).to_numpy()
+                          | ordernumsDiffer(merged_table['ordernum'], merged_table['ordernum_site']))
+    create_rows = [choice_rows[row_number] for row_number in merged_table.loc[missing, 'row_number']]
+    update_rows = [choice_rows[row_number] for row_number in merged_table.loc[changed, 'row_number']]
+    update_ids = merged_table.loc[changed, 'id'].tolist()
+    return create_rows, update_rows, update_ids, int((~missing & ~changed).sum())
+
 
 #---------------------------------------Importing the Choices----------------------------------------------------------------------
 print("\n\n UPLOADING: Importing your choices into your {} ER Site.".format(ER_site_url_name))
 
-for index, row in choices_csv.iterrows():
-    # Auto-defined inputs
-    field_value = row[0]
-    choice_value = row[1]
-    choice_discplay = row[2]
-    ordernum = row[3]
-    
-    # Sending the post requests
-    data_dict = { "model": "activity.event", "field": field_value, "value": choice_value, "display": choice_discplay, "ordernum": ordernum}
-    data_str  = json.dumps(data_dict).replace ('}', ', "is_active": true }')
-    
-    response = requests.post('https://{}.pamdas.org/api/v1.0/choices/'.format(ER_site_url_name), headers=headers, data=data_str)
-    row_array = [row[0],row[1],row[2],row[3]]
-    if response.status_code != 201:
-        print("\n\n\n WARNING: Request returned the http code {0} whilst sending row: {1}. Please check your user-defined inputs in this script and/or your choices.csv file\n\n\n".format(str(response.status_code), str(row_array)))
-        time.sleep((5))
-        problem_rows_table = problem_rows_table.append([[response.status_code] + row_array])
-    else:
-        print("Imported:", str(row_array))
+choice_table, rejected_table = validateChoices(readChoicesCsv(csv_file))
+print(" VALIDATION: {0} rows read, {1} invalid rows rejected and {2} duplicate rows removed, avoiding {3} requests.".format(len(choice_table) + len(rejected_table), int((rejected_table['reason'] != 'duplicate (field, value)').sum()), int((rejected_table['reason'] == 'duplicate (field, value)').sum()), len(rejected_table)))
+if len(rejected_table) > 0:
+    rejected_table.to_csv(rejected_rows_file, index=False)
+    print(" VALIDATION: The rejected rows are listed in the {} file in this script's directory/folder.".format(os.path.basename(rejected_rows_file)))
+choice_rows = choice_table.values.tolist()
+if arguments.resume:
+    confirmed_rows = confirmedRows()
+    resumed_rows = [row_array for row_array in choice_rows if rowKey(row_array) not in confirmed_rows]
+    print(" RESUME: {0} choices already confirmed in the journal are skipped.".format(len(choice_rows) - len(resumed_rows)))
+    choice_rows = resumed_rows
+if sync_with_site:
+    try:
+        site_choices, fetched = loadSiteChoices()
+    except (requests.RequestException, ValueError) as error:
+        print("\nWARNING: The existing choices of your {0} ER Site could not be fetched ({1}). Please check your user-defined inputs in this script.\n\n\n".format(ER_site_url_name, str(error)))
+        time.sleep(10)
+        exit()
+    create_rows, update_rows, update_ids, unchanged_count = planChoiceSync(choice_rows, site_choices)
+    print(" SYNC: {0} choices to create, {1} choices to update and {2} unchanged choices skipped.".format(len(create_rows), len(update_rows), unchanged_count))
+    journal = openJournal(arguments.resume)
+    problem_rows, sent_choices = uploadChoices(create_rows + update_rows, [None] * len(create_rows) + update_ids, journal)
+    # keep the snapshot in step with the choices just created or updated
+    site_choice_index = {(str(choice.get('field')), str(choice.get('value'))): choice for choice in site_choices}
+    for choice in sent_choices:
+        site_choice_index[(str(choice['field']), str(choice['value']))] = choice
+    if all(choice.get('id') is not None for choice in sent_choices):
+        saveSiteChoices(list(site_choice_index.values()), fetched)
+    elif os.path.isfile(snapshot_file):
+        os.remove(snapshot_file) # the ids of the new choices are unknown, they are fetched again in the next run
+else:
+    journal = openJournal(arguments.resume)
+    problem_rows = uploadChoices(choice_rows, journal=journal)[0]
+journal.close()
 
 
 # --------------------------- End of Process ---------------------------
+problem_rows_table = pd.DataFrame(problem_rows)
 if problem_rows_table.size == 0:
     print("\nPROCESS COMPLETED: Choices imported successfully.\n\n\n")
 else:
@@ -0,0 +1,221 @@
+'''-------------------------------------------------------------------------
+Script Name:      GPX to CSV Converter
+Version:          1.0
+Description:      This tool automates the conversion of gpx files (i.e. the
+                    ones made by the CSV/Excel to GPX Converter or by
+                    tracking devices) into csv or parquet tables of track
+                    points.
+Created By:       agent
+Created Date:     2026-10-18
+Last Revised By:  agent
+Last Revision:    2026-10-18
+-------------------------------------------------------------------------'''
+
+if __name__ == "__main__":
+    print("\n\nTOOL - GPX to CSV Converter")
+    print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
+
+
+#Import Libraries
+import datetime
+import numpy as np
+import os
+import pandas as pd
+import pathlib
+import time as t
+import xml.etree.ElementTree as ET
+try:
+    import pyarrow # only needed to save parquet files
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+#---------------------------------------Processing settings----------------------------------------------------------------------
+point_chunk_size = 100000 # number of track points gathered into columns and written to the output file at a time
+
+
+#---------------------------Defining custom functions------------------
+def currentSecondsTime():
+    """ Returns the current time in seconds"""
+    return int(t.time())
+
+def timeTaken(startTime, endTime):
+    """ Returns the difference between a start time and an end time
+        formatted as 00:00:00 """
+    timeTaken = endTime - startTime
+    return str(datetime.timedelta(seconds=timeTaken))
+
+def showPyMessage(message, messageType="Message"):
+    """ Shows a formatted message to the user during processing. """
+    if (messageType == "Message"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Warning"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+    if (messageType == "Error"):
+        os.system('echo ' + str(t.ctime()) + " - " + message + "'")
+        print(message)
+
+def localName(tag):
+    """ Returns an xml tag without its namespace, i.e. trkpt for
+        {http://www.topografix.com/GPX/1/1}trkpt. """
+    return tag.rpartition('}')[2]
+
+def iterTrackPointChunks(gpx_file_name, chunk_size):
+    """ Reads the track points of a gpx file incrementally and yields them in
+        chunks of at most chunk_size points, as tables with the Track,
+        Track_Name, Segment, Latitude, Longitude, Elevation and Datetime
+        columns. Every element is cleared from the tree as soon as it has
+        been read, so the document is never held in memory whatever the size
+        of the file or its number of tracks and segments. """
+    columns = {"Track": [], "Track_Name": [], "Segment": [], "Latitude": [], "Longitude": [], "Elevation": [], "Datetime": []}
+    track_number = 0
+    segment_number = 0
+    track_name = ""
+    path = []
+    parents = []
+    local_names = {}
+    for event, element in ET.iterparse(gpx_file_name, events=("start", "end")):
+        tag = local_names.get(element.tag)
+        if tag is None:
+            tag = local_names.setdefault(element.tag, localName(element.tag))
+        if event == "start":
+            path.append(tag)
+            parents.append(element)
+            if tag == "trk":
+                track_number += 1
+                segment_number = 0
+                track_name = ""
+            elif tag == "trkseg":
+                segment_number += 1
+            continue
+        path.pop()
+        parents.pop()
+        if tag == "trkpt":
+            elevation = time = None
+            for child in element:
+                child_tag = local_names.get(child.tag) or local_names.setdefault(child.tag, localName(child.tag))
+                if child_tag == "ele":
+                    elevation = child.text
+                elif child_tag == "time":
+                    time = child.text
+            columns["Track"].append(track_number)
+            columns["Track_Name"].append(track_name)
+            columns["Segment"].append(segment_number)
+            columns["Latitude"].append(element.get("lat"))
+            columns["Longitude"].append(element.get("lon"))
+            columns["Elevation"].append(elevation)
+            columns["Datetime"].append(time)
+            if len(columns["Track"]) >= chunk_size:
+                yield trackPointTable(columns)
+                columns = {name: [] for name in columns}
+        elif tag == "name" and path and path[-1] == "trk":
+            track_name = (element.text or "").strip()
+        # the points, segments and tracks already read are dropped from the tree
+        if tag in ("trkpt", "trkseg", "trk", "rte", "wpt") and parents:
+            del parents[-1][:]
+    if columns["Track"]:
+        yield trackPointTable(columns)
+
+def trackPointTable(columns):
+    """ Converts lists of track point values into a table of typed columns:
+        float64 coordinates and elevations and the time text as found in the
+        gpx file. """
+    return pd.DataFrame({
+        "Track": np.array(columns["Track"], dtype=np.int64),
+        "Track_Name": columns["Track_Name"],
+        "Segment": np.array(columns["Segment"], dtype=np.int64),
+        "Latitude": pd.to_numeric(pd.Series(columns["Latitude"], dtype=object), errors='coerce').to_numpy(dtype=np.float64),
+        "Longitude": pd.to_numeric(pd.Series(columns["Longitude"], dtype=object), errors='coerce').to_numpy(dtype=np.float64),
+        "Elevation": pd.to_numeric(pd.Series(columns["Elevation"], dtype=object), errors='coerce').to_numpy(dtype=np.float64),
+        "Datetime": columns["Datetime"],
+    })
+
+def writeTrackPointTable(gpx_file_name, output_file_name, output_format):
+    """ Writes the track points of a gpx file chunk by chunk to a csv file or,
+        with the times parsed to UTC timestamps, to a parquet file. Returns
+        the number of track points written. """
+    point_count = 0
+    parquet_writer = None
+    try:
+        for track_points in iterTrackPointChunks(gpx_file_name, point_chunk_size):
+            if output_format == "csv":
+                track_points.to_csv(output_file_name, mode="w" if point_count == 0 else "a", header=point_count == 0, index=False)
+            else:
+                # a fixed time unit, as pandas infers seconds, micro or nanoseconds from the times of each chunk
+                track_points["Datetime"] = pd.to_datetime(track_points["Datetime"], format='ISO8601', utc=True, errors='coerce').astype("datetime64[ns, UTC]")
+                track_point_table = pyarrow.Table.from_pandas(track_points, preserve_index=False, schema=parquet_writer.schema if parquet_writer is not None else None)
+                if parquet_writer is None:
+                    parquet_writer = pyarrow.parquet.ParquetWriter(output_file_name, track_point_table.schema)
+                parquet_writer.write_table(track_point_table)
+            point_count += len(track_points)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    return point_count
+
+
+if __name__ == "__main__":
+    #---------------------------------------Declaring Data Paths and output format----------------------------------------------------------------------
+    ## Target gpx input
+    target_file = input("\nAbsolute path of the target gpx file (MANDATORY): ")
+    if target_file == "":
+        print("REMINDER: When running this tool, remember to specify the absolute path of the target gpx file according to request above.")
+        t.sleep(10)
+        exit()
+    if not os.path.isfile(target_file):
+        print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the gpx file actually exists.")
+        t.sleep(10)
+        exit()
+    target_file_name = os.path.basename(target_file) # capturing just the name of the gpx input
+
+    ## Output format input
+    output_format_input = input("\nEnter 1 to save the track points as a csv file OR 2 to save them as a parquet file (OPTIONAL, if you leave answer as empty by pressing enter 1 is used): ").strip()
+    if output_format_input in ('', '1'):
+        output_format = "csv"
+    elif output_format_input == '2':
+        output_format = "parquet"
+        if pyarrow is None:
+            print("REMINDER: The pyarrow library is needed to save parquet files. Install it using your pip package (i.e. from your terminal run 'pip install pyarrow') and run the tool again.")
+            t.sleep(10)
+            exit()
+    else:
+        print("REMINDER: When running this tool, remember to answer the output format question with either 1 or 2.")
+        t.sleep(10)
+        exit()
+
+
+    #-----------------------------------------------Preparing the environment---------------------------------------------
+    os.chdir(pathlib.Path(target_file).parent.absolute())
+
+
+    startTime = currentSecondsTime()
+
+
+    #--------------------------------------------------STEP 1: Reading the track points into a table---------------------------------------------
+    print("\nStep 1: Reading the track points of your " + target_file_name + " file into a " + output_format + " table.")
+    output_file_name = os.path.join(os.path.dirname(target_file), os.path.splitext(target_file_name)[0].replace(' ', '_') + "_points." + output_format)
+    try:
+        point_count = writeTrackPointTable(target_file, output_file_name, output_format)
+    except ET.ParseError as error:
+        print("REMINDER: Ensure that your gpx file is a complete and valid xml file (" + str(error) + ").")
+        t.sleep(10)
+        exit()
+    except ValueError as error:
+        print("REMINDER: The track points of your gpx file could not be saved as a " + output_format + " table (" + str(error) + ").")
+        t.sleep(10)
+        exit()
+    if point_count == 0:
+        print("REMINDER: Your gpx file does not hold any track points.")
+        t.sleep(10)
+        exit()
+    print("Saved " + str(point_count) + " track points to " + os.path.basename(output_file_name) + ".")
+
+    endTime = currentSecondsTime()
+
+
+    # --------------------------- End of Process ---------------------------
+    print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(target_file).parent.absolute()) + ".")
+    showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
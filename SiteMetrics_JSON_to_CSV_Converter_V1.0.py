@@ -9,36 +9,41 @@ Last Revised By:  Kusasalethu Sithole
 Last Revision:    2020-08-12
 -------------------------------------------------------------------------'''
 
-print("\n\nTOOL - Site Metrics' JSON to CSV Converter")
-print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
+if __name__ == "__main__":
+    print("\n\nTOOL - Site Metrics' JSON to CSV Converter")
+    print("\nReminder - For this tool to execute successfully, your machine needs:\n\t 1) the pip package and have its bin directory mapped in the machines 'path' system environment variable.\n\t 2) The pandas library is installed using your pip package (i.e. from your terminal run 'pip install pandas'.")
 
 
 #Import Libraries
+import concurrent.futures
 import datetime
+import hashlib
+import json
 import os
 import pandas as pd
 import pathlib
+import re
+import shutil
 import time as t
+try:
+    import ijson # only needed to stream large json files
+except ImportError:
+    ijson = None
+try:
+    import pyarrow # only needed to save parquet files
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
-#---------------------------------------Declaring Input Data----------------------------------------------------------------------
-## Target json input
-json_file = input("\nAbsolute path of the target json file (MANDATORY): ")
-if json_file == "":
-    print("REMINDER: When running this tool, remember to specify the absolute path of the target json file according to request above.")
-    t.sleep(10)
-    exit()
-if not os.path.isfile(json_file):
-    print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the json file actually exists.")
-    t.sleep(10)
-    exit()
-
-json_df = pd.read_json (json_file)   # Load the json input file
-json_name = os.path.basename(json_file) # capturing just the name of the json input
-    
-
-#-----------------------------------------------Preparing the environment---------------------------------------------
-os.chdir(pathlib.Path(json_file).parent.absolute())
+#---------------------------------------Processing settings----------------------------------------------------------------------
+streaming_batch_size = 10000 # number of report rows converted and written to the output file at a time in streaming mode
+metric_dtypes = {"INTEGER": "Int64", "FLOAT": "float64", "PERCENT": "float64", "TIME": "float64", "CURRENCY": "float64"} # dtypes of the metric types of a report in parquet files, other types are kept as text
+category_ratio = 0.5 # dimensions whose share of distinct values is at most this ratio are stored as categories in parquet files
+parquet_compression = "zstd" # compression codec of the parquet files
+dataset_directory_name = "site_metrics_dataset" # directory, within a directory of reports, of the consolidated parquet dataset partitioned by report
+manifest_file_name = "_manifest.json" # file, within the dataset directory, recording the content hash of every report already converted
+report_worker_count = os.cpu_count() # number of worker processes converting the reports of a directory in parallel
 
 
 #---------------------------Defining custom functions------------------
@@ -64,97 +69,382 @@ def showPyMessage(message, messageType="Message"):
         os.system('echo ' + str(t.ctime()) + " - " + message + "'")
         print(message)
 
+def columnName(header_name):
+    """ Returns a report header name without its prefix, i.e. date for
+        ga:date. """
+    return str(header_name).rsplit(':', 1)[-1]
 
-startTime = currentSecondsTime()
+def dateRangeCount(rows):
+    """ Returns the number of date ranges holding the metrics of a report. """
+    return max(1, len(rows[0]['metrics'])) if rows else 1
 
+def reportColumns(column_header, date_range_count):
+    """ Returns the dimension column names and, for each date range of the
+        report, the metric column names. The metrics of the first date range
+        keep their names and those of the next ranges get the number of their
+        range as a suffix, i.e. sessions, sessions_2, sessions_3. """
+    dimension_columns = [columnName(dimension) for dimension in column_header.get('dimensions', [])]
+    metric_names = [columnName(metric['name']) for metric in column_header['metricHeader']['metricHeaderEntries']]
+    metric_columns = [[name if date_range == 0 else name + "_" + str(date_range + 1) for name in metric_names] for date_range in range(date_range_count)]
+    return dimension_columns, metric_columns
 
-#--------------------------------------------------STEP 1: Deriving the target columns and creating the output csv template---------------------------------------------
-print("\nStep 1: Deriving the target columns from your " + json_name + " file and creating the output csv template.")
+def buildReportTable(column_header, rows):
+    """ Builds the table of a report from its column header and its rows,
+        whatever the number of dimensions, metrics and date ranges. The values
+        are gathered column by column and the table is created once. """
+    dimension_columns, metric_columns = reportColumns(column_header, dateRangeCount(rows))
+    table_columns = {}
+    if dimension_columns:
+        dimension_values = list(zip(*[row['dimensions'] for row in rows])) if rows else [()] * len(dimension_columns)
+        for name, values in zip(dimension_columns, dimension_values):
+            table_columns[name] = values
+    for date_range, names in enumerate(metric_columns):
+        metric_values = list(zip(*[row['metrics'][date_range]['values'] for row in rows])) if rows else [()] * len(names)
+        for name, values in zip(names, metric_values):
+            table_columns[name] = values
+    return pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in table_columns.items()}, columns=dimension_columns + sum(metric_columns, []))
 
-target_columns = []
+def typeReportTable(report_table, column_header, categorical_dimensions=None):
+    """ Casts the metric columns of a report table to the numeric dtypes of
+        their metric header types and stores the dimensions with few distinct
+        values as categories, unless the categorical dimensions are given.
+        Returns the typed table and the names of its categorical dimensions. """
+    typed_table = report_table.copy()
+    metric_types = [metric.get('type', '') for metric in column_header['metricHeader']['metricHeaderEntries']]
+    date_range_count = max(1, (len(report_table.columns) - len(column_header.get('dimensions', []))) // max(1, len(metric_types)))
+    dimension_columns, metric_columns = reportColumns(column_header, date_range_count)
+    for names in metric_columns:
+        for name, metric_type in zip(names, metric_types):
+            if metric_type in metric_dtypes:
+                typed_table[name] = pd.to_numeric(typed_table[name], errors='coerce').astype(metric_dtypes[metric_type])
+    if categorical_dimensions is None:
+        categorical_dimensions = [name for name in dimension_columns if typed_table[name].nunique() <= category_ratio * len(typed_table)]
+    for name in dimension_columns:
+        typed_table[name] = typed_table[name].astype("category" if name in categorical_dimensions else str)
+    return typed_table, categorical_dimensions
 
-for column in json_df['columnHeader']['dimensions']:
-    target_columns.append(str(column.rsplit(':')[1]))
-len_col1 = len(json_df['columnHeader']['dimensions'])
-    
-for column in json_df['columnHeader']['metricHeader']['metricHeaderEntries']:
-    target_columns.append(column['name'].rsplit(':')[1])
-len_col2 = len(json_df['columnHeader']['metricHeader']['metricHeaderEntries'])
+def parquetSchema(typed_table, categorical_dimensions):
+    """ Returns the parquet schema of a typed report table. Categorical
+        dimensions are dictionary encoded with the same index type in every
+        batch so that the batches of a report can be written to one file. """
+    schema_fields = []
+    for name, dtype in typed_table.dtypes.items():
+        if name in categorical_dimensions:
+            field_type = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        elif str(dtype) == "Int64":
+            field_type = pyarrow.int64()
+        elif str(dtype) == "float64":
+            field_type = pyarrow.float64()
+        else:
+            field_type = pyarrow.string()
+        schema_fields.append(pyarrow.field(name, field_type))
+    return pyarrow.schema(schema_fields)
+
+def loadReport(json_file):
+    """ Loads a whole report and returns its column header and its rows. """
+    json_df = pd.read_json (json_file)   # Load the json input file
+    column_header = json_df['columnHeader'].dropna().to_dict()
+    report_rows = json_df['data']['rows'] if 'rows' in json_df.index and isinstance(json_df['data']['rows'], list) else []
+    return column_header, report_rows
+
+def readColumnHeader(json_file):
+    """ Reads only the column header of a report with an event-based json
+        parser, stopping as soon as the header has been read. """
+    with open(json_file, "rb") as report:
+        for column_header in ijson.items(report, 'columnHeader', use_float=True):
+            return column_header
+    raise ValueError("The json file does not hold a report columnHeader.")
+
+def iterReportRowBatches(json_file, batch_size):
+    """ Yields the rows of a report in lists of at most batch_size rows,
+        parsing the data.rows array incrementally. """
+    batch = []
+    with open(json_file, "rb") as report:
+        for row in ijson.items(report, 'data.rows.item', use_float=True):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def writeParquetTable(report_table, column_header, output_file_name):
+    """ Writes a report table to a compressed parquet file with typed metrics
+        and categorical dimensions. """
+    typed_table, categorical_dimensions = typeReportTable(report_table, column_header)
+    parquet_table = pyarrow.Table.from_pandas(typed_table, schema=parquetSchema(typed_table, categorical_dimensions), preserve_index=False)
+    pyarrow.parquet.write_table(parquet_table, output_file_name, compression=parquet_compression)
+
+def streamReportTable(json_file, output_file_name, batch_size, output_format="csv"):
+    """ Converts a report to csv or parquet batch by batch, never loading more
+        than batch_size rows. The csv file is the same as the one of the
+        in-memory conversion, while in a parquet file the categorical
+        dimensions are chosen from the first batch. Returns the number of rows
+        written. """
+    column_header = readColumnHeader(json_file)
+    row_count = 0
+    parquet_writer = None
+    try:
+        for rows in iterReportRowBatches(json_file, batch_size):
+            report_table = buildReportTable(column_header, rows)
+            if output_format == "csv":
+                report_table.index = pd.RangeIndex(row_count, row_count + len(report_table))
+                report_table.to_csv(output_file_name, mode="w" if row_count == 0 else "a", header=row_count == 0)
+            else:
+                if parquet_writer is None:
+                    typed_table, categorical_dimensions = typeReportTable(report_table, column_header)
+                    schema = parquetSchema(typed_table, categorical_dimensions)
+                    parquet_writer = pyarrow.parquet.ParquetWriter(output_file_name, schema, compression=parquet_compression)
+                else:
+                    typed_table = typeReportTable(report_table, column_header, categorical_dimensions)[0]
+                parquet_writer.write_table(pyarrow.Table.from_pandas(typed_table, schema=schema, preserve_index=False))
+            row_count += len(report_table)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    if row_count == 0:
+        if output_format == "csv":
+            buildReportTable(column_header, []).to_csv(output_file_name)
+        else:
+            writeParquetTable(buildReportTable(column_header, []), column_header, output_file_name)
+    return row_count
+
+def hashFile(target_file):
+    """ Returns the sha256 hex digest of the contents of a file. """
+    file_hash = hashlib.sha256()
+    with open(target_file, "rb") as target:
+        for block in iter(lambda: target.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def loadManifest(manifest_file):
+    """ Returns the manifest of the reports already converted into a dataset,
+        or an empty one when the dataset is new or its manifest unreadable. """
+    try:
+        with open(manifest_file, "r", encoding="UTF-8") as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+def saveManifest(manifest_file, manifest):
+    """ Saves the manifest atomically, so that an interrupted run keeps the
+        record of every report converted before it stopped. """
+    temporary_manifest_file = manifest_file + ".tmp"
+    with open(temporary_manifest_file, "w", encoding="UTF-8") as manifest_copy:
+        json.dump(manifest, manifest_copy, indent=1, sort_keys=True)
+    os.replace(temporary_manifest_file, manifest_file)
+
+def findChangedReports(report_directory, manifest):
+    """ Returns the json reports of a directory which are new or whose
+        contents changed since they were recorded in the manifest, with their
+        size, modification time and content hash. Reports whose size and
+        modification time are unchanged are not hashed again. """
+    changed_reports = {}
+    for report_name in sorted(os.listdir(report_directory)):
+        report_file = os.path.join(report_directory, report_name)
+        if not report_name.lower().endswith(".json") or not os.path.isfile(report_file):
+            continue
+        report_stat = os.stat(report_file)
+        record = manifest.get(report_name, {})
+        if record.get("size") == report_stat.st_size and record.get("mtime_ns") == report_stat.st_mtime_ns:
+            continue
+        content_hash = hashFile(report_file)
+        if record.get("sha256") == content_hash:
+            record.update(size=report_stat.st_size, mtime_ns=report_stat.st_mtime_ns) # touched but unchanged
+            continue
+        changed_reports[report_name] = {"size": report_stat.st_size, "mtime_ns": report_stat.st_mtime_ns, "sha256": content_hash}
+    return changed_reports
+
+def pruneRemovedReports(report_directory, dataset_directory, manifest):
+    """ Removes from the dataset and the manifest the reports recorded in the
+        manifest which are no longer in the directory (deleted or renamed).
+        Returns the names of the removed reports. """
+    removed_reports = [report_name for report_name in manifest if not os.path.isfile(os.path.join(report_directory, report_name))]
+    for report_name in removed_reports:
+        record = manifest.pop(report_name)
+        if "partition" not in record:
+            continue
+        if any(other_record.get("partition") == record["partition"] for other_record in manifest.values()):
+            # the partition is shared with another report by an older run, only this report's part file goes
+            if "part" in record and os.path.isfile(os.path.join(dataset_directory, record["partition"], record["part"])):
+                os.remove(os.path.join(dataset_directory, record["partition"], record["part"]))
+        else:
+            shutil.rmtree(os.path.join(dataset_directory, record["partition"]), ignore_errors=True)
+    return removed_reports
+
+def assignPartitions(report_names, manifest):
+    """ Returns the name of the dataset partition of every report, i.e.
+        report=2020-08-12_metrics for 2020-08-12 metrics.json. Reports keep
+        the partition recorded in the manifest. Any other report whose name
+        is already taken (i.e. by "a b.json" for "a_b.json") gets a short
+        hash of its file name added, so that no two reports share a
+        partition. """
+    partitions = {}
+    for report_name in sorted(report_names, key=lambda name: (name not in manifest, name)):
+        partition = manifest.get(report_name, {}).get("partition")
+        if partition is None or partition in partitions.values():
+            partition = "report=" + re.sub(r'[^\w\-.]+', '_', os.path.splitext(report_name)[0])
+            if partition in partitions.values():
+                partition += "-" + hashlib.sha256(report_name.encode("UTF-8")).hexdigest()[:8]
+        partitions[report_name] = partition
+    return partitions
+
+def convertReportToPartition(report_file, partition_directory, content_hash, processing_mode, previous_part_file=None):
+    """ Converts one report into a parquet part file of its dataset partition,
+        then removes the part file of its previous contents recorded in the
+        manifest. Runs in the worker processes of the directory mode. Returns
+        the part file name and the number of rows. """
+    os.makedirs(partition_directory, exist_ok=True)
+    part_file_name = "part-" + content_hash[:16] + ".parquet"
+    temporary_part_file = os.path.join(partition_directory, "." + part_file_name + ".tmp")
+    try:
+        if processing_mode == '2':
+            row_count = streamReportTable(report_file, temporary_part_file, streaming_batch_size, "parquet")
+        else:
+            column_header, report_rows = loadReport(report_file)
+            writeParquetTable(buildReportTable(column_header, report_rows), column_header, temporary_part_file)
+            row_count = len(report_rows)
+    except Exception:
+        if os.path.exists(temporary_part_file):
+            os.remove(temporary_part_file)
+        if not os.listdir(partition_directory):
+            os.rmdir(partition_directory)
+        raise
+    os.replace(temporary_part_file, os.path.join(partition_directory, part_file_name))
+    if previous_part_file is not None and previous_part_file != os.path.join(partition_directory, part_file_name) and os.path.isfile(previous_part_file):
+        os.remove(previous_part_file)
+    return part_file_name, row_count
+
+
+if __name__ == "__main__":
+    #---------------------------------------Declaring Input Data----------------------------------------------------------------------
+    ## Target json input
+    json_file = input("\nAbsolute path of the target json file, or of a directory of json files to convert the new or changed ones into one parquet dataset (MANDATORY): ")
+    if json_file == "":
+        print("REMINDER: When running this tool, remember to specify the absolute path of the target json file according to request above.")
+        t.sleep(10)
+        exit()
+    if not os.path.isfile(json_file) and not os.path.isdir(json_file):
+        print("REMINDER: Ensure that the absolute path provided above is both typed correctly and the json file actually exists.")
+        t.sleep(10)
+        exit()
+    directory_mode = os.path.isdir(json_file)
+
+    json_name = os.path.basename(json_file) # capturing just the name of the json input
+
+    ## Processing mode input
+    processing_mode = input("\nHow would you like your json file to be processed? Enter 1 to load the whole file into memory; OR enter 2 for streaming mode, which parses the report rows incrementally and writes them in batches so that memory use stays constant (recommended for very large files, requires the ijson library, i.e. from your terminal run 'pip install ijson') (OPTIONAL, if you leave answer as empty by pressing enter option 1 is used): ").strip()
+    if processing_mode == "":
+        processing_mode = '1'
+    if processing_mode not in ('1', '2'):
+        print("REMINDER: When running this tool, remember to answer the processing mode question with either 1 or 2.")
+        t.sleep(10)
+        exit()
+    if processing_mode == '2' and ijson is None:
+        print("REMINDER: The ijson library is needed for streaming mode. Install it using your pip package (i.e. from your terminal run 'pip install ijson') and run the tool again.")
+        t.sleep(10)
+        exit()
+
+    ## Output format input
+    if directory_mode:
+        output_format = "parquet" # the reports of a directory are consolidated into a parquet dataset
+    else:
+        output_format = input("\nEnter 1 to save the report as a csv file OR 2 to save it as a compressed parquet file with numeric metrics and categorical dimensions (requires the pyarrow library, i.e. from your terminal run 'pip install pyarrow') (OPTIONAL, if you leave answer as empty by pressing enter option 1 is used): ").strip()
+        if output_format in ('', '1'):
+            output_format = "csv"
+        elif output_format == '2':
+            output_format = "parquet"
+        else:
+            print("REMINDER: When running this tool, remember to answer the output format question with either 1 or 2.")
+            t.sleep(10)
+            exit()
+    if output_format == "parquet" and pyarrow is None:
+        print("REMINDER: The pyarrow library is needed to save parquet files. Install it using your pip package (i.e. from your terminal run 'pip install pyarrow') and run the tool again.")
+        t.sleep(10)
+        exit()
     
-output_csv = pd.DataFrame(columns=target_columns)
-
-print("len_col1:" + str(len_col1),"len_col2:" + str(len_col2))
-
-#--------------------------------------------------STEP 2: Populating the csv template and saving data as csv file format---------------------------------------------
-print("\nStep 2: Populating the csv template and saving data as csv file format.")
-
-if len_col1 == 5 and len_col2 == 6:
-    for row in json_df['data']['rows']:
-        output_csv = output_csv.append(pd.DataFrame([[
-        row['dimensions'][0],
-        row['dimensions'][1],
-        row['dimensions'][2],
-        row['dimensions'][3],
-        row['dimensions'][4],
-        row['metrics'][0]['values'][0],
-        row['metrics'][0]['values'][1],
-        row['metrics'][0]['values'][2],
-        row['metrics'][0]['values'][3],
-        row['metrics'][0]['values'][4],
-        row['metrics'][0]['values'][5]
-    ]], columns=target_columns), ignore_index=True)
-elif len_col1 == 6 and len_col2 == 6:
-    for row in json_df['data']['rows']:
-        output_csv = output_csv.append(pd.DataFrame([[
-        row['dimensions'][0],
-        row['dimensions'][1],
-        row['dimensions'][2],
-        row['dimensions'][3],
-        row['dimensions'][4],
-        row['dimensions'][5],
-        row['metrics'][0]['values'][0],
-        row['metrics'][0]['values'][1],
-        row['metrics'][0]['values'][2],
-        row['metrics'][0]['values'][3],
-        row['metrics'][0]['values'][4],
-        row['metrics'][0]['values'][5]
-    ]], columns=target_columns), ignore_index=True)
-elif len_col1 == 4 and len_col2 == 5:
-    for row in json_df['data']['rows']:
-        output_csv = output_csv.append(pd.DataFrame([[
-        row['dimensions'][0],
-        row['dimensions'][1],
-        row['dimensions'][2],
-        row['dimensions'][3],
-        row['metrics'][0]['values'][0],
-        row['metrics'][0]['values'][1],
-        row['metrics'][0]['values'][2],
-        row['metrics'][0]['values'][3],
-        row['metrics'][0]['values'][4]
-    ]], columns=target_columns), ignore_index=True)
-elif len_col1 == 5 and len_col2 == 5:
-    for row in json_df['data']['rows']:
-        output_csv = output_csv.append(pd.DataFrame([[
-        row['dimensions'][0],
-        row['dimensions'][1],
-        row['dimensions'][2],
-        row['dimensions'][3],
-        row['dimensions'][4],
-        row['metrics'][0]['values'][0],
-        row['metrics'][0]['values'][1],
-        row['metrics'][0]['values'][2],
-        row['metrics'][0]['values'][3],
-        row['metrics'][0]['values'][4]
-    ]], columns=target_columns), ignore_index=True)
-
-output_csv_file_name = json_file[:-5] + ".csv"
-output_csv.to_csv(output_csv_file_name)
-
-endTime = currentSecondsTime()
-
-
-# --------------------------- End of Process ---------------------------
-print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(json_file).parent.absolute()) + ".")
-showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))
+
+    #-----------------------------------------------Preparing the environment---------------------------------------------
+    os.chdir(pathlib.Path(json_file).absolute() if directory_mode else pathlib.Path(json_file).parent.absolute())
+
+
+    startTime = currentSecondsTime()
+
+
+    if directory_mode:
+        #--------------------------------------------------STEP 1: Finding the new or changed reports---------------------------------------------
+        print("\nStep 1: Finding the new or changed json reports in your " + json_name + " directory.")
+        dataset_directory = os.path.join(os.path.abspath(json_file), dataset_directory_name)
+        os.makedirs(dataset_directory, exist_ok=True)
+        manifest_file = os.path.join(dataset_directory, manifest_file_name)
+        manifest = loadManifest(manifest_file)
+        removed_reports = pruneRemovedReports(json_file, dataset_directory, manifest)
+        changed_reports = findChangedReports(json_file, manifest)
+        partitions = assignPartitions(set(manifest) | set(changed_reports), manifest)
+        for report_name, record in manifest.items():
+            if report_name not in changed_reports and record.get("partition") != partitions[report_name]:
+                changed_reports[report_name] = {"size": record["size"], "mtime_ns": record["mtime_ns"], "sha256": record["sha256"]} # moved out of a shared partition
+        saveManifest(manifest_file, manifest)
+        if removed_reports:
+            print(str(len(removed_reports)) + " reports no longer in the directory removed from the dataset: " + ", ".join(removed_reports))
+        print(str(len(changed_reports)) + " new or changed reports to convert.")
+
+        #--------------------------------------------------STEP 2: Converting the reports into the dataset---------------------------------------------
+        print("\nStep 2: Converting the reports in parallel into the partitioned parquet dataset " + dataset_directory_name + ".")
+        failed_reports = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=report_worker_count) as executor:
+            conversions = {}
+            for report_name, record in changed_reports.items():
+                previous_record = manifest.get(report_name, {})
+                previous_part_file = os.path.join(dataset_directory, previous_record["partition"], previous_record["part"]) if "partition" in previous_record and "part" in previous_record else None
+                conversions[executor.submit(convertReportToPartition, os.path.join(os.path.abspath(json_file), report_name), os.path.join(dataset_directory, partitions[report_name]), record["sha256"], processing_mode, previous_part_file)] = report_name
+            for conversion in concurrent.futures.as_completed(conversions):
+                report_name = conversions[conversion]
+                try:
+                    part_file_name, row_count = conversion.result()
+                except Exception as error:
+                    failed_reports.append(report_name + " (" + " ".join(str(error).split()) + ")")
+                    continue
+                # checkpoint every converted report so that an interrupted run resumes where it stopped
+                manifest[report_name] = dict(changed_reports[report_name], rows=row_count, partition=partitions[report_name], part=part_file_name, converted=datetime.datetime.now().isoformat(timespec='seconds'))
+                saveManifest(manifest_file, manifest)
+                print("Converted " + report_name + ": " + str(row_count) + " report rows.")
+        if failed_reports:
+            print("REMINDER: Ensure that the following json files are complete Site Metrics reports, they were not converted and will be retried in the next run: " + ", ".join(failed_reports))
+
+    else:
+        #--------------------------------------------------STEP 1: Deriving the target columns and creating the output csv template---------------------------------------------
+        print("\nStep 1: Deriving the target columns from your " + json_name + " file and creating the output csv template.")
+
+        if processing_mode == '1':
+            column_header, report_rows = loadReport(json_file)
+            dimension_columns, metric_columns = reportColumns(column_header, dateRangeCount(report_rows))
+            print("Dimensions: " + str(len(dimension_columns)) + ", metrics: " + str(len(metric_columns[0])) + ", date ranges: " + str(len(metric_columns)))
+        else:
+            print("Streaming mode: the columns are derived from the report's columnHeader while its rows are converted.")
+
+        #--------------------------------------------------STEP 2: Populating the csv template and saving data as csv file format---------------------------------------------
+        print("\nStep 2: Populating the csv template and saving data as " + output_format + " file format.")
+
+        output_csv_file_name = json_file[:-5] + "." + output_format
+        if processing_mode == '1':
+            output_csv = buildReportTable(column_header, report_rows)
+            if output_format == "csv":
+                output_csv.to_csv(output_csv_file_name)
+            else:
+                writeParquetTable(output_csv, column_header, output_csv_file_name)
+        else:
+            try:
+                row_count = streamReportTable(json_file, output_csv_file_name, streaming_batch_size, output_format)
+            except (ValueError, ijson.JSONError) as error:
+                print("REMINDER: Ensure that your json file is a complete Site Metrics report (" + str(error) + ").")
+                t.sleep(10)
+                exit()
+            print("Converted " + str(row_count) + " report rows.")
+
+    endTime = currentSecondsTime()
 
 
+    # --------------------------- End of Process ---------------------------
+    print("\n\nProcess completed. Please refer to your output files in the directory: " + str(pathlib.Path(json_file).absolute() if directory_mode else pathlib.Path(json_file).parent.absolute()) + ".")
+    showPyMessage(" -- Process took {}. ".format(timeTaken(startTime, endTime)))